@@ -0,0 +1,200 @@
+import time
+import weakref
+import numpy as np
+
+from storage import Frame
+
+# Common clock for every acquisition thread: monotonic (perf_counter) but
+# expressed in epoch seconds, so frames from several devices can be aligned.
+CLOCK_OFFSET = time.time() - time.perf_counter()
+
+
+def clock():
+    return CLOCK_OFFSET + time.perf_counter()
+
+
+# acquisition modes -> seabreeze trigger mode (0: normal, 3: external hardware edge)
+ACQUISITION_MODES = {"free-run": 0, "fixed-rate": 0, "triggered": 3}
+
+# integration time (ms) each open handle was last programmed with; a new Acquisition
+# on the same handle (Start, background capture, reconnect) knows whether it changes it
+DETECTOR_TIMES = weakref.WeakKeyDictionary()
+
+
+def set_integration_time(spectrometer, integration_time):
+    # True if the detector was (or may have been) integrating at another time
+    try:
+        changed = DETECTOR_TIMES.get(spectrometer) != integration_time
+    except TypeError:  # handle without weak references: assume a change
+        changed = True
+    spectrometer.integration_time_micros(integration_time * 1000)
+    try:
+        DETECTOR_TIMES[spectrometer] = integration_time
+    except TypeError:
+        pass
+    return changed
+
+
+def parse_sweep(text):
+    # "10, 20, 50" or "10:100:10" (start:stop:step, stop included), or a mix of both
+    times = []
+    for part in text.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        if ":" in part:
+            start, stop, step = (float(v) for v in part.split(":"))
+            if step <= 0:
+                raise ValueError("Sweep step must be positive.")
+            times.extend(np.arange(start, stop + step / 2, step).round(6).tolist())
+        else:
+            times.append(float(part))
+    if not times:
+        raise ValueError("Sweep has no integration times.")
+    if not all(3.8 <= t <= 10000 for t in times):
+        raise ValueError("Integration times must be between 3.8 and 10000.")
+    repeated = sorted({t for t in times if times.count(t) > 1})
+    if repeated:
+        # read_sweep keys the steps by time: a repeated step would have no key of its own
+        raise ValueError(f"Integration times are repeated: {', '.join(f'{t:g}' for t in repeated)}.")
+    return times
+
+
+def skip_frames(schedule, count):
+    # what is left of a [(integration time, frames), ...] schedule after count frames
+    remaining = []
+    for integration_time, frames in schedule:
+        done = min(count, frames)
+        count -= done
+        if frames > done:
+            remaining.append((integration_time, frames - done))
+    return remaining
+
+
+class Acquisition:
+    # Qt-free acquisition loop shared by the GUI (MeasurementThread) and the CLI.
+    def __init__(self, spectrometer, buffer, integration_time, num_measurements=None, writer=None,
+                 mode="free-run", period=None, averager=None, correction=None, start_index=0, source=None,
+                 schedule=None, auto_exposure=None, qc=None, peak_tracker=None,
+                 band_integrator=None, settle_reads=1):
+        self.spectrometer = spectrometer
+        self.buffer = buffer
+        self.integration_time = integration_time
+        self.num_measurements = num_measurements
+        self.writer = writer
+        self.mode = mode
+        self.period = period  # seconds between reads in fixed-rate mode
+        self.averager = averager  # one emitted frame per averager.scans reads
+        self.correction = correction  # dark/reference stage applied before buffering
+        self.start_index = start_index  # frame numbering continues after a reconnect
+        self.source = source  # device key carried by every frame
+        # exposure series: [(integration time ms, frames), ...] run back-to-back
+        self.schedule = schedule
+        self.auto_exposure = auto_exposure  # processing.AutoExposure adjusting the time every frame
+        self.qc = qc  # processing.FrameQC run on every raw read
+        self.peak_tracker = peak_tracker  # processing.PeakTracker run on every output frame
+        self.band_integrator = band_integrator  # processing.BandIntegrator for the kinetics view
+        # the first read(s) after an integration-time change may still be integrated at the old time
+        self.settle_reads = settle_reads
+        self.settle = 0
+        self.error = None
+        self.is_running = True
+
+    def run(self, emit=None):
+        steps = self.schedule or [(self.integration_time, self.num_measurements)]
+        self.spectrometer.trigger_mode(ACQUISITION_MODES[self.mode])
+        self.count = 0
+        self.next_deadline = time.perf_counter()
+        for integration_time, frames in steps:
+            if not self.is_running or self.error is not None:
+                break
+            # switching steps only reprograms the detector: no thread or file restart
+            self.integration_time = integration_time
+            self.set_integration_time(integration_time)
+            if self.averager is not None:
+                self.averager.reset()
+            self.run_step(frames, emit)
+        if self.mode == "triggered" and self.error is None:
+            self.spectrometer.trigger_mode(ACQUISITION_MODES["free-run"])
+
+    def run_step(self, frames, emit):
+        count = 0
+        next_deadline = self.next_deadline
+        # in triggered mode intensities() blocks until the external trigger arrives
+        while self.is_running and (frames is None or count < frames):
+            if self.mode == "fixed-rate" and (self.averager is None or self.averager.count == 0):
+                # pace against absolute deadlines so read time does not accumulate as drift
+                delay = next_deadline - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                next_deadline += self.period
+                now = time.perf_counter()
+                if next_deadline < now:
+                    # overrun: skip the slots we missed instead of bursting to catch up
+                    next_deadline += self.period * ((now - next_deadline) // self.period + 1)
+            try:
+                intensities = self.spectrometer.intensities()
+            except Exception as e:  # USB glitch or unplugged device
+                if self.is_running:
+                    self.error = e
+                break
+            if not self.is_running:
+                break  # the read stop() released
+            if self.settle:
+                self.settle -= 1
+                continue  # discarded, never counted for the step
+            integration_time = self.integration_time  # the time this frame was taken with
+            if self.qc is not None:
+                self.qc.check(intensities)
+            new_time = integration_time
+            if self.auto_exposure is not None:
+                new_time = self.auto_exposure.update(intensities, integration_time)
+            if self.averager is not None:
+                intensities = self.averager.add(intensities)
+            if new_time != integration_time:
+                self.integration_time = new_time
+                self.set_integration_time(new_time)  # a settle read is saved under neither time
+                if self.averager is not None:
+                    self.averager.reset()  # never average scans of different exposures
+            if intensities is None:
+                continue
+            if self.correction is not None:
+                intensities = self.correction.apply(intensities)
+            timestamp = clock()
+            qc = self.qc.take() if self.qc is not None else (0, 0, 0)
+            peaks = self.peak_tracker.update(intensities) if self.peak_tracker is not None else None
+            bands = self.band_integrator.integrate(intensities) if self.band_integrator is not None else None
+            slot = self.buffer.write(intensities)
+            if self.writer is not None:
+                self.writer.put(intensities, timestamp, integration_time, qc[0], qc[1], peaks)
+            if emit is not None:
+                emit(Frame(self.start_index + self.count, timestamp, self.buffer.buffer[slot], self.source,
+                           integration_time, qc, peaks, bands))
+            count += 1
+            self.count += 1
+        self.next_deadline = next_deadline
+
+    def set_integration_time(self, integration_time):
+        # a free-running detector may return one more read integrated at the old time;
+        # a triggered read always starts a fresh exposure
+        if set_integration_time(self.spectrometer, integration_time) and self.mode != "triggered":
+            self.settle = self.settle_reads
+        else:
+            self.settle = 0
+
+    def stop(self):
+        self.is_running = False
+        if self.mode == "triggered":
+            # intensities() waits for an external trigger that may never come;
+            # back in free-run the pending read completes and is discarded
+            try:
+                self.spectrometer.trigger_mode(ACQUISITION_MODES["free-run"])
+            except Exception:
+                pass
+
+    def abort(self):
+        # last resort for a read that stop() could not release: closing the device makes it fail
+        try:
+            self.spectrometer.close()
+        except Exception:
+            pass
@@ -0,0 +1,147 @@
+# Headless acquisition/render/save benchmark on the simulated spectrometer.
+#
+#   python benchmark.py --frames 100 1000 10000 100000 --output bench.json
+#
+# Every run length is measured in a fresh subprocess so peak RSS is per run.
+import os
+import sys
+import json
+import time
+import argparse
+import shutil
+import platform
+import subprocess
+import tempfile
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / 2**20 if sys.platform == "darwin" else rss / 2**10
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q / 100 * len(values)))]
+
+
+def run_once(frames, file_format, integration_time, realtime):
+    import numpy as np
+    from PyQt5.QtWidgets import QApplication, QMessageBox
+    from devices import SimulatedBackend
+    from acquisition import clock
+    import ispectra
+
+    # no modal dialogs without a display
+    QMessageBox.information = staticmethod(lambda *args, **kwargs: None)
+    ispectra.SpectrometerApp.show_alert = lambda self, message: None
+
+    app = QApplication(sys.argv[:1])
+    window = ispectra.SpectrometerApp(SimulatedBackend(realtime=realtime, seed=0))
+    while window.ax is None or window.spectrometer is None:  # deferred startup
+        app.processEvents()
+    window.file_path = tempfile.mkdtemp(prefix="ispectra-bench-")
+    window.save_file_radio.setChecked(True)
+    window.file_format_combo.setCurrentIndex(max(window.file_format_combo.findData(file_format), 0))
+    window.integration_time_input.setText(str(integration_time))
+    window.num_measurements_checkbox.setChecked(True)
+    window.num_measurements_input.setText(str(frames))
+
+    # acquisition-to-screen latency of each frame that actually got drawn
+    latencies = []
+    drawn = [None]
+
+    def frame_drawn():
+        run = next(iter(window.runs.values()), None)
+        frame = run.latest_frame if run is not None else None
+        if frame is not None and frame.index != drawn[0]:
+            drawn[0] = frame.index
+            latencies.append(clock() - frame.timestamp)
+    window.display_timer.timeout.connect(frame_drawn)
+    saved = []
+    window.saveFinished.connect(lambda ok: saved.append((time.perf_counter(), ok)))
+
+    start = time.perf_counter()
+    window.start_measurement()
+    while window.is_measuring:
+        app.processEvents()
+    acquired = time.perf_counter()
+    while not saved:
+        app.processEvents()
+        time.sleep(0.001)
+    save_end, ok = saved[0]
+
+    size = sum(os.path.getsize(os.path.join(window.file_path, f)) for f in os.listdir(window.file_path))
+    shutil.rmtree(window.file_path)
+    window.close()
+    rendered = window.measurement_counter - window.dropped_frames
+    return {
+        "frames": frames,
+        "format": window.file_format_combo.currentData(),
+        "integration_time_ms": integration_time,
+        "realtime": realtime,
+        "acquired": window.measurement_counter,
+        "spectra_per_s": window.measurement_counter / (acquired - start),
+        "rendered_fps": rendered / (acquired - start),
+        "dropped_display_frames": window.dropped_frames,
+        "latency_ms_p50": None if not latencies else 1000 * percentile(latencies, 50),
+        "latency_ms_p95": None if not latencies else 1000 * percentile(latencies, 95),
+        "save_s": save_end - acquired,
+        "saved": ok,
+        "file_mb": size / 2**20,
+        "peak_rss_mb": peak_rss_mb(),
+        "numpy": np.__version__,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="IICO-Spectra benchmark")
+    parser.add_argument("--frames", type=int, nargs="+", default=[100, 1000, 10000, 100000])
+    parser.add_argument("--format", default="hdf5", help="output format (csv or hdf5)")
+    parser.add_argument("--integration-time", type=float, default=3.8, help="ms")
+    parser.add_argument("--realtime", action="store_true", help="pace the simulator like real hardware")
+    parser.add_argument("--output", default="bench.json")
+    parser.add_argument("--single", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.single:
+        result = run_once(args.frames[0], args.format, args.integration_time, args.realtime)
+        print(json.dumps(result))
+        return
+
+    runs = []
+    for frames in args.frames:
+        command = [sys.executable, os.path.abspath(__file__), "--single", "--frames", str(frames),
+                   "--format", args.format, "--integration-time", str(args.integration_time)]
+        if args.realtime:
+            command.append("--realtime")
+        output = subprocess.run(command, check=True, capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        print(f"{frames:>7} frames: {result['spectra_per_s']:9.1f} spectra/s  {result['rendered_fps']:6.1f} fps  "
+              f"latency p95 {result['latency_ms_p95'] or 0:7.1f} ms  save {result['save_s']:6.2f} s  "
+              f"rss {result['peak_rss_mb'] or 0:7.1f} MB")
+        runs.append(result)
+
+    report = {
+        "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "runs": runs,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+import time
+import numpy as np
+
+
+class SeabreezeBackend:
+    # Ocean Optics devices through python-seabreeze, imported on first use.
+    name = "seabreeze"
+
+    def __init__(self):
+        self.sb = None
+
+    def load(self):
+        if self.sb is None:
+            import seabreeze.spectrometers as sb
+            self.sb = sb
+        return self.sb
+
+    def list_devices(self):
+        return self.load().list_devices()
+
+    def device_id(self, device):
+        return device.serial_number
+
+    def open(self, device):
+        return self.load().Spectrometer(device)
+
+
+class SimulatedSpectrometer:
+    # Synthetic HR4000-like device with the subset of the seabreeze Spectrometer
+    # API used by the app. Like the real detector it integrates continuously, so
+    # intensities() blocks until the current integration period has finished.
+    max_intensity = 16383  # 14-bit
+
+    def __init__(self, serial_number="SIM00001", pixels=3648, wavelength_range=(195.4, 1119.0),
+                 peaks=((450.0, 20.0, 8000.0), (530.0, 35.0, 5000.0), (590.0, 15.0, 6000.0)),
+                 noise=8.0, dark_offset=520.0, readout_time=0.0, realtime=True, replay=None, seed=None,
+                 unplugged=()):
+        self.model = "HR4000-SIM"
+        self.serial_number = serial_number
+        self.peaks = peaks  # (center nm, FWHM nm, counts at 100 ms)
+        self.noise = noise
+        self.dark_offset = dark_offset
+        self.readout_time = readout_time
+        self.realtime = realtime  # False returns frames immediately (benchmarks)
+        self.unplugged = unplugged  # serials currently "disconnected" by the backend
+        self.rng = np.random.default_rng(seed)
+        self.replay_frames = None
+        if replay is not None:
+            data = np.loadtxt(replay, delimiter=",", skiprows=1)
+            self._wavelengths = data[:, 0].copy()
+            self.replay_frames = np.ascontiguousarray(data[:, 1:].T)
+            self.replay_index = 0
+        else:
+            self._wavelengths = np.linspace(wavelength_range[0], wavelength_range[1], pixels)
+        self.pixels = len(self._wavelengths)
+        self.noise_buffer = np.zeros(self.pixels)
+        self.trigger = 0
+        self.next_ready = time.perf_counter()
+        self.integration_time_micros(100000)
+
+    def integration_time_micros(self, integration_time):
+        self.integration_time = integration_time / 1e6
+        scale = self.integration_time / 0.1
+        signal = np.full(self.pixels, self.dark_offset)
+        for center, fwhm, amplitude in self.peaks:
+            sigma = fwhm / 2.3548
+            signal += amplitude * scale * np.exp(-0.5 * ((self._wavelengths - center) / sigma) ** 2)
+        self.signal = signal
+
+    def trigger_mode(self, mode):
+        self.trigger = mode
+
+    def wavelengths(self):
+        return self._wavelengths.copy()
+
+    def intensities(self, correct_dark_counts=False, correct_nonlinearity=False):
+        if self.serial_number in self.unplugged:
+            raise OSError(f"{self.serial_number} disconnected")
+        if self.realtime:
+            now = time.perf_counter()
+            self.next_ready = max(self.next_ready + self.integration_time, now)
+            delay = self.next_ready + self.readout_time - now
+            if delay > 0:
+                time.sleep(delay)
+        if self.replay_frames is not None:
+            frame = self.replay_frames[self.replay_index].copy()
+            self.replay_index = (self.replay_index + 1) % len(self.replay_frames)
+            return frame
+        self.rng.standard_normal(out=self.noise_buffer)
+        frame = self.signal + self.noise * self.noise_buffer
+        np.rint(frame, out=frame)
+        np.clip(frame, 0, self.max_intensity, out=frame)
+        return frame
+
+    def close(self):
+        pass
+
+
+class SimulatedBackend:
+    # Stand-in for SeabreezeBackend that needs no hardware; keyword arguments
+    # are passed on to every SimulatedSpectrometer it opens. unplug()/plug()
+    # emulate USB hot-plug.
+    name = "simulated"
+
+    def __init__(self, num_devices=1, **options):
+        self.num_devices = num_devices
+        self.options = options
+        self.unplugged = set()
+
+    def list_devices(self):
+        devices = [f"SIM{i + 1:05d}" for i in range(self.num_devices)]
+        return [device for device in devices if device not in self.unplugged]
+
+    def device_id(self, device):
+        return device
+
+    def open(self, device):
+        if device in self.unplugged:
+            raise OSError(f"{device} disconnected")
+        return SimulatedSpectrometer(serial_number=device, unplugged=self.unplugged, **self.options)
+
+    def unplug(self, device):
+        self.unplugged.add(device)
+
+    def plug(self, device):
+        self.unplugged.discard(device)
+
+
+BACKENDS = {"seabreeze": SeabreezeBackend, "simulated": SimulatedBackend}
@@ -1,36 +1,58 @@
 import sys
-import os
+import time
+import argparse
+
+# startup timing marks, printed with --profile-startup
+startup_marks = [("start", time.perf_counter())]
+
+def startup_mark(label):
+    startup_marks.append((label, time.perf_counter()))
+
 from PyQt5.QtWidgets import (
     QMainWindow, QApplication, QWidget, QVBoxLayout, QHBoxLayout, QLabel, QPushButton, QRadioButton,
-    QSlider, QStyleFactory, QFrame, QLineEdit, QSpacerItem, QSizePolicy, QMessageBox, QFileDialog,QCheckBox
+    QSlider, QStyleFactory, QFrame, QLineEdit, QSpacerItem, QSizePolicy, QMessageBox, QFileDialog,QCheckBox,QComboBox,QProgressDialog
 )
 from PyQt5.QtCore import (QObject, pyqtSignal, Qt, QThreadPool, QThread,QMutex,QMutexLocker,pyqtSlot,QTimer)
 from PyQt5.QtGui import QIcon, QPixmap, QFont, QFontDatabase
-from matplotlib.figure import Figure
-import matplotlib.pyplot as plt
-from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
-from matplotlib.backends.backend_qt5agg import NavigationToolbar2QT as NavigationToolbar
+startup_mark("import PyQt5")
+
+import numpy as np
+startup_mark("import numpy")
+
+from acquisition import Acquisition, ACQUISITION_MODES, parse_sweep, skip_frames
+from devices import BACKENDS, SeabreezeBackend
+from processing import (ScanAverager, Correction, AutoExposure, FrameQC, PeakTracker, BandIntegrator, MinMaxDecimator,
+                        parse_bands, PROCESSING_MODES)
+from storage import (RingBuffer, StreamWriter, DecimatedHistory, SINKS, HDF5_AVAILABLE, MAX_PEAKS,
+                     save_file_with_number)
+from liveplot import LivePlot, LiveToolbar
+startup_mark("import app modules")
 
-import seabreeze.spectrometers as sb
-from datetime import date
-import csv
 
-# matplotlib params:
-plt.rcParams['axes.linewidth']    = 1.5
-plt.rcParams['axes.grid.which']   = 'both'
-plt.rcParams['axes.labelsize']    = 15
-plt.rcParams['xtick.direction']   = 'in'
-plt.rcParams['xtick.labelsize']   = 13
-plt.rcParams['ytick.labelsize']   = 13
-plt.rcParams['ytick.direction']   = 'in'
-plt.rcParams['xtick.major.size']  = 5
-# mpl.rcParams['xtick.minor.size']  = 2.5
-plt.rcParams['xtick.major.width'] = 1.5
-# mpl.rcParams['xtick.minor.width'] = 1.5
-plt.rcParams['ytick.major.size']  = 5
-# mpl.rcParams['ytick.minor.size']  = 2.5
-plt.rcParams['ytick.major.width'] = 1.5
-# mpl.rcParams['ytick.minor.width'] = 1.5
+def set_plot_style(rcParams):
+    # matplotlib params:
+    rcParams['axes.linewidth']    = 1.5
+    rcParams['axes.grid.which']   = 'both'
+    rcParams['axes.labelsize']    = 15
+    rcParams['xtick.direction']   = 'in'
+    rcParams['xtick.labelsize']   = 13
+    rcParams['ytick.labelsize']   = 13
+    rcParams['ytick.direction']   = 'in'
+    rcParams['xtick.major.size']  = 5
+    # rcParams['xtick.minor.size']  = 2.5
+    rcParams['xtick.major.width'] = 1.5
+    # rcParams['xtick.minor.width'] = 1.5
+    rcParams['ytick.major.size']  = 5
+    # rcParams['ytick.minor.size']  = 2.5
+    rcParams['ytick.major.width'] = 1.5
+    # rcParams['ytick.minor.width'] = 1.5
+
+
+def print_startup_profile():
+    print("Startup profile (ms):")
+    for (_, t0), (label, t1) in zip(startup_marks, startup_marks[1:]):
+        print(f"  {label:<24}{(t1 - t0) * 1000:9.1f}")
+    print(f"  {'total':<24}{(startup_marks[-1][1] - startup_marks[0][1]) * 1000:9.1f}")
 
 
 
@@ -45,68 +67,186 @@ def npath(p):
     new_path = part1 + f"{s}...{s}" + part2
     return new_path
 
-def save_file_with_number(name,it, path):
-    base_name = name 
-    ext = ".csv"
-    today_date = date.today().strftime('%Y-%m-%d')
 
-    counter = 0
+class MeasurementThread(QThread):
+    measurementFinished = pyqtSignal(object)
+    measurementFailed = pyqtSignal(object, str)  # device key, message
 
-    new_name = f"{base_name}-{it}ms-{today_date}{ext}"
-    complete_path = os.path.join(path, new_name)
+    def __init__(self, *args, **kwargs):
+        super().__init__()
+        self.acquisition = Acquisition(*args, **kwargs)
 
-    while os.path.exists(complete_path):
-        counter += 1
-        new_name = f"{base_name}{counter}-{it}ms-{today_date}{ext}"
-        complete_path = os.path.join(path, new_name)
+    def run(self):
+        self.acquisition.run(self.measurementFinished.emit)
+        if self.acquisition.error is not None:
+            self.measurementFailed.emit(self.acquisition.source, str(self.acquisition.error))
 
-    return complete_path
+    def stop(self):
+        # True if the thread ended on its own; otherwise the device was closed to end it
+        acquisition = self.acquisition
+        acquisition.stop()
+        # stop is seen after the read in progress: one exposure, after a fixed-rate pause
+        timeout = acquisition.integration_time + (acquisition.period or 0) * 1000 + 2000
+        if self.wait(int(timeout)):
+            return True
+        if acquisition.mode != "triggered":
+            self.wait()  # a free-running read always returns: never close the device under it
+            return True
+        acquisition.abort()  # a trigger that never comes
+        self.wait(2000)
+        return False
 
 
-class MeasurementThread(QThread):
-    measurementFinished = pyqtSignal(list)
+class DeviceMonitor(QThread):
+    # Polls the backend for plugged/unplugged devices off the GUI thread and keeps
+    # the opened handles cached by serial number. Paused during measurements, as
+    # nothing needs to be found then. While a failed device is being reconnected,
+    # polling resumes but never closes or reopens a handle an acquisition thread
+    # is still reading (`busy`).
+    devicesChanged = pyqtSignal(object, object)  # {key: handle}, {key: wavelengths}
 
-    def __init__(self, spectrometer, integration_time, num_measurements=None):
+    def __init__(self, backend, interval=1.0, fast_interval=0.2):
         super().__init__()
-        self.spectrometer = spectrometer
-        self.integration_time = integration_time
-        self.num_measurements = num_measurements
+        self.backend = backend
+        self.interval = interval
+        self.fast_interval = fast_interval  # while waiting for a device to come back
+        self.handles = {}
+        self.wavelengths = {}  # calibration read right after opening, before any acquisition uses the handle
+        self.stale = set()
+        self.waiting = set()  # keys of failed devices to reopen
+        self.busy = set()  # keys whose handles acquisition threads are using
+        self.paused = False
+        self.polling = QMutex()
         self.is_running = True
 
     def run(self):
-        self.spectrometer.integration_time_micros(self.integration_time * 1000)
-        if self.num_measurements is not None:
-            for _ in range(self.num_measurements):
-                if not self.is_running:
-                    break
-                wavelengths = self.spectrometer.wavelengths()
-                intensities = self.spectrometer.intensities()
-                self.measurementFinished.emit([wavelengths, intensities])
-                QThread.msleep(100)
-        else:
-            while self.is_running:
-                wavelengths = self.spectrometer.wavelengths()
-                intensities = self.spectrometer.intensities()
-                self.measurementFinished.emit([wavelengths, intensities])
-                QThread.msleep(100)
+        with QMutexLocker(self.polling):
+            self.poll(force=True)
+        while self.is_running:
+            deadline = time.monotonic() + (self.fast_interval if self.waiting else self.interval)
+            while self.is_running and time.monotonic() < deadline:
+                QThread.msleep(20)
+            with QMutexLocker(self.polling):
+                if self.is_running and not self.paused:
+                    self.poll()
+
+    def pause(self, paused=True):
+        # returns once no poll is in flight
+        with QMutexLocker(self.polling):
+            self.paused = paused
+
+    def set_busy(self, keys):
+        with QMutexLocker(self.polling):
+            self.busy = set(keys)
+
+    def poll(self, force=False):
+        try:
+            found = {self.backend.device_id(d): d for d in self.backend.list_devices()}
+        except Exception:
+            found = {}
+        changed = force
+        for key in list(self.handles):
+            if key in self.busy:
+                continue  # an enumeration miss must not close a handle that is being read
+            if key not in found or key in self.stale:
+                self.stale.discard(key)
+                self.wavelengths.pop(key, None)
+                self.close_handle(self.handles.pop(key))
+                changed = True
+        for key, device in found.items():
+            if key not in self.handles:
+                spectrometer = None
+                try:
+                    spectrometer = self.backend.open(device)
+                    self.wavelengths[key] = spectrometer.wavelengths()
+                    self.handles[key] = spectrometer
+                    self.waiting.discard(key)
+                    changed = True
+                except Exception:  # not ready yet, retry on the next poll
+                    if spectrometer is not None:
+                        self.close_handle(spectrometer)
+        if changed:
+            self.devicesChanged.emit(dict(self.handles), dict(self.wavelengths))
+
+    def invalidate(self, key):
+        # the handle failed: reopen it once the device shows up again
+        self.stale.add(key)
+        self.waiting.add(key)
+
+    def close_handle(self, spectrometer):
+        try:
+            spectrometer.close()
+        except Exception:
+            pass
 
     def stop(self):
         self.is_running = False
         self.wait()
-        
+        for spectrometer in self.handles.values():
+            self.close_handle(spectrometer)
+
+
+class DeviceRun:
+    # One spectrometer taking part in a measurement: its own acquisition thread,
+    # ring buffer and writer, plus the state the display timer needs.
+    def __init__(self, key, spectrometer, wavelengths, buffer, writer, settings, line):
+        self.key = key
+        self.spectrometer = spectrometer
+        self.wavelengths = wavelengths
+        self.buffer = buffer
+        self.writer = writer
+        self.settings = settings  # Acquisition keyword arguments
+        self.line = line
+        self.thread = None
+        self.latest_frame = None
+        self.counter = 0
+        self.pending_frames = 0
+        self.saturated_frames = 0  # QC totals
+        self.spikes = 0
+        self.hot_pixels = 0
+        self.history = None  # DecimatedHistory of band intensities (kinetics view)
+        self.t0 = None
+        self.waterfall = None  # DecimatedHistory of binned spectra, one row per image line
+        self.waterfall_edges = None
+        self.waterfall_bins = None
+        self.waterfall_row = None
+        self.display_sum = np.zeros(len(wavelengths))
+        self.display_frame = np.zeros(len(wavelengths))
+        self.decimator = MinMaxDecimator(wavelengths)  # what the line actually draws
+
+
+LINE_COLORS = ['tab:blue', 'tab:orange', 'tab:green', 'tab:red', 'tab:purple', 'tab:brown', 'tab:pink', 'tab:cyan']
+
+
 class SpectrometerApp(QMainWindow):
-    def __init__(self):
+    saveFinished = pyqtSignal(bool)
+    startupFinished = pyqtSignal()  # plot built and first device discovery reported
+
+    def __init__(self, backend=None):
         super().__init__()
+        self.backend = backend if backend is not None else SeabreezeBackend()
         self.spectrometer = None
+        self.device_key = None
+        self.device_handles = {}
+        self.device_wavelengths = {}
+        self.reconnecting = set()  # keys of devices a paused run waits for
         self.is_measuring = False
         self.thread = None
         self.worker = None
-        self.measurement_thread = None
-        self.measurement_counter = 0
-        self.data = []
+        self.runs = {}  # device key -> DeviceRun
+        self.schedule = None  # [(integration time, frames), ...] of an exposure series
+        self.run_total = None  # frames per device before the run stops by itself
+        self.pending_saves = 0
+        self.saves_ok = True
+        self.closing_writers = []  # writers still finishing their file after a stop
+        self.measurement_counter = 0  # totals over all devices
+        self.dropped_frames = 0
+        self.capture_thread = None
+        self.dark_spectrum = {}  # device key -> (integration time, spectrum)
+        self.reference_spectrum = {}
         self.file_name = ""
         self.file_path = ""
-        self.wavelengths = []
+        self.wavelengths = []  # calibration, read once per device connection
         self.integration_time = 3.8
         self.save_file = False
         self.setWindowTitle("IICO-Spectra")
@@ -172,14 +312,27 @@ class SpectrometerApp(QMainWindow):
         #------------------------------------- box 0-------------------------------------------------------------       
         box0_layout = QHBoxLayout()
         sidebar_layout.addLayout(box0_layout)
-        # Device name label
+        # Device name label and selector
         self.device_name_label = QLabel("Device: N/A")
         box0_layout.addWidget(self.device_name_label)
+        self.device_combo = QComboBox()
+        self.device_combo.currentIndexChanged.connect(self.select_device)
+        box0_layout.addWidget(self.device_combo)
+        self.all_devices_checkbox = QCheckBox("All devices")
+        self.all_devices_checkbox.setChecked(False)
+        box0_layout.addWidget(self.all_devices_checkbox)
         
         # Save file radiobox
         self.save_file_radio = QRadioButton("Save File")
         self.save_file_radio.setChecked(False)
         box0_layout.addWidget(self.save_file_radio)
+
+        # Output format
+        self.file_format_combo = QComboBox()
+        self.file_format_combo.addItem("CSV", "csv")
+        if HDF5_AVAILABLE:
+            self.file_format_combo.addItem("HDF5", "hdf5")
+        box0_layout.addWidget(self.file_format_combo)
        
        
         #------------------------------------- box 1-------------------------------------------------------------       
@@ -225,11 +378,106 @@ class SpectrometerApp(QMainWindow):
         self.integration_time_input = QLineEdit()
         self.integration_time_input.setText("3.8")
         int_time_layout.addWidget(self.integration_time_input)
+
+        exposure_layout = QHBoxLayout()
+        sidebar_layout.addLayout(exposure_layout)
+        # Auto exposure keeps the peak at a fraction of full scale (16383 counts)
+        self.auto_exposure_checkbox = QCheckBox("Auto exposure")
+        self.auto_exposure_checkbox.setChecked(False)
+        exposure_layout.addWidget(self.auto_exposure_checkbox)
+        target_label = QLabel("Target (%):")
+        exposure_layout.addWidget(target_label)
+        self.exposure_target_input = QLineEdit()
+        self.exposure_target_input.setText("80")
+        exposure_layout.addWidget(self.exposure_target_input)
+        self.exposure_label = QLabel("")
+        exposure_layout.addWidget(self.exposure_label)
+
+        sweep_layout = QHBoxLayout()
+        sidebar_layout.addLayout(sweep_layout)
+        # Exposure series run back-to-back into one file; empty runs a single integration time
+        sweep_label = QLabel("Sweep (ms):")
+        sweep_layout.addWidget(sweep_label)
+        self.sweep_input = QLineEdit()
+        self.sweep_input.setPlaceholderText("10:100:10 or 10, 20, 50")
+        sweep_layout.addWidget(self.sweep_input)
+        frames_per_step_label = QLabel("Frames/step:")
+        sweep_layout.addWidget(frames_per_step_label)
+        self.frames_per_step_input = QLineEdit()
+        self.frames_per_step_input.setText("10")
+        sweep_layout.addWidget(self.frames_per_step_input)
+
+        mode_layout = QHBoxLayout()
+        sidebar_layout.addLayout(mode_layout)
+        # Acquisition mode and period (fixed-rate only)
+        mode_label = QLabel("Mode:")
+        mode_layout.addWidget(mode_label)
+        self.acquisition_mode_combo = QComboBox()
+        self.acquisition_mode_combo.addItems(list(ACQUISITION_MODES))
+        mode_layout.addWidget(self.acquisition_mode_combo)
+        period_label = QLabel("Period (ms):")
+        mode_layout.addWidget(period_label)
+        self.period_input = QLineEdit()
+        self.period_input.setText("100")
+        mode_layout.addWidget(self.period_input)
+
+        averaging_layout = QHBoxLayout()
+        sidebar_layout.addLayout(averaging_layout)
+        # Scans averaged into each frame and boxcar half-width (pixels)
+        scans_label = QLabel("Scans to average:")
+        averaging_layout.addWidget(scans_label)
+        self.scans_to_average_input = QLineEdit()
+        self.scans_to_average_input.setText("1")
+        averaging_layout.addWidget(self.scans_to_average_input)
+        boxcar_label = QLabel("Boxcar width:")
+        averaging_layout.addWidget(boxcar_label)
+        self.boxcar_width_input = QLineEdit()
+        self.boxcar_width_input.setText("0")
+        averaging_layout.addWidget(self.boxcar_width_input)
+        
+        buffer_layout = QHBoxLayout()
+        sidebar_layout.addLayout(buffer_layout)
+        # Frames on their way to the plot; saved frames are streamed to disk
+        buffer_label = QLabel("Buffer depth (frames):")
+        buffer_layout.addWidget(buffer_label)
+
+        self.buffer_depth_input = QLineEdit()
+        self.buffer_depth_input.setText("64")
+        buffer_layout.addWidget(self.buffer_depth_input)
         
         separator1 = QFrame()
         separator1.setFrameShape(QFrame.HLine)
         separator1.setFrameShadow(QFrame.Sunken)
         sidebar_layout.addWidget(separator1)
+
+        background_layout = QHBoxLayout()
+        sidebar_layout.addLayout(background_layout)
+        # Dark and reference (lamp) spectra, each the average of N frames
+        self.capture_dark_button = QPushButton("Capture dark")
+        self.capture_dark_button.clicked.connect(lambda: self.capture_background("dark"))
+        background_layout.addWidget(self.capture_dark_button)
+        self.capture_reference_button = QPushButton("Capture reference")
+        self.capture_reference_button.clicked.connect(lambda: self.capture_background("reference"))
+        background_layout.addWidget(self.capture_reference_button)
+        background_frames_label = QLabel("Frames:")
+        background_layout.addWidget(background_frames_label)
+        self.background_frames_input = QLineEdit()
+        self.background_frames_input.setText("10")
+        background_layout.addWidget(self.background_frames_input)
+
+        processing_layout = QHBoxLayout()
+        sidebar_layout.addLayout(processing_layout)
+        processing_label = QLabel("Processing:")
+        processing_layout.addWidget(processing_label)
+        self.processing_combo = QComboBox()
+        self.processing_combo.addItems(PROCESSING_MODES)
+        processing_layout.addWidget(self.processing_combo)
+        self.background_label = QLabel("Dark: none | Reference: none")
+        processing_layout.addWidget(self.background_label)
+        # peaks found and tracked in the acquisition thread, annotated on the plot and saved per frame
+        self.track_peaks_checkbox = QCheckBox("Track peaks")
+        self.track_peaks_checkbox.setChecked(False)
+        processing_layout.addWidget(self.track_peaks_checkbox)
         #-----------------------------------------------------------------------------------------------------  
 
 
@@ -250,9 +498,18 @@ class SpectrometerApp(QMainWindow):
         self.stop_button = QPushButton("Stop")
         self.stop_button.clicked.connect(self.stop_measurement)
         run_layout.addWidget(self.stop_button)
+        counter_layout = QHBoxLayout()
+        sidebar_layout.addLayout(counter_layout)
         self.measurement_counter_label = QLabel("Measurements: 0")
         #self.measurement_counter_label.setAlignment(Qt.AlignCenter)
-        sidebar_layout.addWidget(self.measurement_counter_label)
+        counter_layout.addWidget(self.measurement_counter_label)
+        self.rate_label = QLabel("Rate: 0.0 spectra/s")
+        counter_layout.addWidget(self.rate_label)
+        self.dropped_frames_label = QLabel("Dropped (display only): 0")
+        sidebar_layout.addWidget(self.dropped_frames_label)
+        # per-frame QC of the displayed device, totals for the run
+        self.qc_label = QLabel("QC: saturated frames 0 | spikes 0 | hot pixels 0")
+        sidebar_layout.addWidget(self.qc_label)
         
         
         
@@ -321,6 +578,41 @@ class SpectrometerApp(QMainWindow):
         
         # expander_sidebars1= QSpacerItem(self.sidebar_width, 20, QSizePolicy.Minimum, QSizePolicy.Expanding)
         # sidebar_layout.addItem(expander_sidebars1)
+        refresh_layout = QHBoxLayout()
+        sidebar_layout.addLayout(refresh_layout)
+        # the plot is refreshed on a timer; frames arriving in between are recorded but not drawn
+        refresh_label = QLabel("Refresh (ms):")
+        refresh_layout.addWidget(refresh_label)
+        self.refresh_interval_input = QLineEdit()
+        self.refresh_interval_input.setText("33")
+        refresh_layout.addWidget(self.refresh_interval_input)
+        self.display_average_checkbox = QCheckBox("Average between refreshes")
+        self.display_average_checkbox.setChecked(False)
+        refresh_layout.addWidget(self.display_average_checkbox)
+        # publication: matplotlib, every panel; live: Qt-native spectrum plot for fast refresh rates
+        renderer_label = QLabel("Renderer:")
+        refresh_layout.addWidget(renderer_label)
+        self.renderer_combo = QComboBox()
+        self.renderer_combo.addItems(["publication", "live"])
+        self.renderer_combo.currentTextChanged.connect(self.set_renderer)
+        refresh_layout.addWidget(self.renderer_combo)
+
+        kinetics_layout = QHBoxLayout()
+        sidebar_layout.addLayout(kinetics_layout)
+        # Kinetics: band intensities over time in a strip chart under the spectrum
+        self.kinetics_checkbox = QCheckBox("Kinetics")
+        self.kinetics_checkbox.setChecked(False)
+        kinetics_layout.addWidget(self.kinetics_checkbox)
+        bands_label = QLabel("Bands (nm):")
+        kinetics_layout.addWidget(bands_label)
+        self.bands_input = QLineEdit()
+        self.bands_input.setText("440-460, 520-540")
+        kinetics_layout.addWidget(self.bands_input)
+        # Waterfall: every frame of the run as a time x wavelength image
+        self.waterfall_checkbox = QCheckBox("Waterfall")
+        self.waterfall_checkbox.setChecked(False)
+        kinetics_layout.addWidget(self.waterfall_checkbox)
+
         separator3 = QFrame()
         separator3.setFrameShape(QFrame.HLine)
         separator3.setFrameShadow(QFrame.Sunken)
@@ -339,31 +631,130 @@ class SpectrometerApp(QMainWindow):
         #sidebar_layout.addStretch()
         layout.addWidget(sidebar)
 
-        # Plot area
+        # Plot area, filled in by setup_plot once the window is showing
         self.plot_layout = QVBoxLayout()  # Cambio a QVBoxLayout
+        self.ax = None
+        self.renderer = "publication"
+        layout.addLayout(self.plot_layout)
+        self.show()
+        QApplication.processEvents()  # paint the sidebar before the slow parts below
+        startup_mark("build window")
+        
+        self.mutex = QMutex()  # Crear una instancia de QMutex
+        self.saveFinished.connect(self.data_saved)
+        self.display_timer = QTimer(self)
+        self.display_timer.timeout.connect(self.render_display)
+        # matplotlib and USB enumeration are slow: run them after the first paint
+        QTimer.singleShot(0, self.setup_plot)
+        self.device_monitor = DeviceMonitor(self.backend)
+        self.device_monitor.devicesChanged.connect(self.devices_changed)
+        self.devices_found = None
+        self.startup_pending = {"plot", "devices"}
+        QTimer.singleShot(0, self.device_monitor.start)
+
+    def setup_plot(self):
+        from matplotlib import rcParams
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
+        from matplotlib.backends.backend_qt5agg import NavigationToolbar2QT as NavigationToolbar
+        startup_mark("import matplotlib")
+        set_plot_style(rcParams)
         self.fig = Figure(figsize=(10, 6))
-        self.ax = self.fig.add_subplot(111)
+        # the spectrum takes the whole figure or shares it with the waterfall and kinetics panels
+        self.grid = self.fig.add_gridspec(6, 1)
+        self.ax = self.fig.add_subplot(self.grid[:, 0])
         self.ax.set_xlabel('Wavelength (nm)')
         self.ax.set_ylabel('Intensity')
+        self.ax.set_xlim([self.xlim_min_slider.value(), self.xlim_max_slider.value()])
+        self.ax.set_ylim([self.ylim_min_slider.value(), self.ylim_max_slider.value()])
+        # one persistent line per device: frames only update its data and are blitted over a cached background
+        self.lines = {}
+        self.peak_markers, = self.ax.plot([], [], 'v', color='black', animated=True)
+        self.peak_labels = [self.ax.text(0, 0, "", ha='center', va='bottom', fontsize=9, animated=True, clip_on=True)
+                            for _ in range(MAX_PEAKS)]
+        self.waterfall_ax = self.fig.add_subplot(self.grid[3:5, 0], sharex=self.ax)
+        self.waterfall_ax.set_ylabel('Time (s)')
+        self.waterfall_ax.set_autoscale_on(False)
+        self.waterfall_image = self.waterfall_ax.imshow(np.zeros((1, 1)), aspect='auto', origin='lower',
+                                                        cmap='viridis', animated=True)
+        self.waterfall_ax.set_visible(False)
+        self.kinetics_ax = self.fig.add_subplot(self.grid[5, 0])
+        self.kinetics_ax.set_xlabel('Time (s)')
+        self.kinetics_ax.set_ylabel('Band intensity')
+        self.kinetics_ax.set_visible(False)
+        self.kinetics_lines = []
+        self.ax.callbacks.connect('xlim_changed', self.refresh_traces)
+        self.background = None
         self.fig.tight_layout()
         self.canvas = FigureCanvas(self.fig)
+        self.canvas.mpl_connect('draw_event', self.on_draw)
+        self.canvas.mpl_connect('resize_event', self.on_resize)
         self.toolbar = NavigationToolbar(self.canvas, self)
         self.plot_layout.addWidget(self.canvas)
         self.plot_layout.addWidget(self.toolbar)  # Agregar el toolbar al layout
-        layout.addLayout(self.plot_layout)
-        self.show()
-        
-        self.mutex = QMutex()  # Crear una instancia de QMutex
-        self.check_spectrometers()
+        self.live_plot = LivePlot()
+        self.live_plot.limitsChanged.connect(self.live_limits_changed)
+        self.live_plot.resized.connect(self.refresh_traces)
+        self.live_toolbar = LiveToolbar(self.live_plot)
+        self.plot_layout.addWidget(self.live_plot)
+        self.plot_layout.addWidget(self.live_toolbar)
+        self.live_colors = {}
+        self.live_plot.hide()
+        self.live_toolbar.hide()
+        if self.renderer == "live":
+            self.set_renderer(self.renderer)
+        startup_mark("build plot")
+        self.startup_step_done("plot")
 
-    def check_spectrometers(self):
-        spec_list = sb.list_devices()
-        if len(spec_list) == 0:
-            QMessageBox.warning(self, "No spectrometers found", "No spectrometers found connected. Please check the connection and try again.")
-        else:
+    @pyqtSlot(object, object)
+    def devices_changed(self, handles, wavelengths):
+        first = self.devices_found is None
+        self.devices_found = bool(handles)
+        if first:
+            startup_mark("device discovery")
+            self.startup_step_done("devices")
+        self.device_handles = handles
+        self.device_wavelengths = wavelengths
+        self.device_combo.blockSignals(True)
+        self.device_combo.clear()
+        for key, spectrometer in handles.items():
+            self.device_combo.addItem(f"{spectrometer.model} ({key})", key)
+        self.device_combo.blockSignals(False)
+
+        if self.device_key in handles:
+            # the handle may have been reopened
+            self.device_combo.setCurrentIndex(self.device_combo.findData(self.device_key))
+            self.select_device(self.device_combo.currentIndex())
+        elif handles and self.device_key not in self.reconnecting:
             # select the spectometer
-            self.spectrometer = sb.Spectrometer(spec_list[0])
-            self.device_name_label.setText(f"Device: {self.spectrometer.model}")
+            self.select_device(0)
+        else:
+            self.spectrometer = None
+            self.device_name_label.setText("Device: reconnecting..." if self.device_key in self.reconnecting else "Device: N/A")
+            if first:
+                QMessageBox.warning(self, "No spectrometers found", "No spectrometers found connected. Please check the connection and try again.")
+        for key in list(self.reconnecting):
+            if key in handles:
+                self.resume_measurement(key, handles[key])
+
+    def startup_step_done(self, step):
+        self.startup_pending.discard(step)
+        if not self.startup_pending:
+            self.startupFinished.emit()
+
+    def select_device(self, index):
+        key = self.device_combo.itemData(index)
+        if key is None or key not in self.device_handles:
+            return
+        self.device_key = key
+        self.spectrometer = self.device_handles[key]
+        self.wavelengths = self.wavelengths_for(key)
+        self.device_name_label.setText(f"Device: {self.spectrometer.model}")
+        self.update_background_label()
+
+    def wavelengths_for(self, key):
+        # read by the device monitor when it opened the handle, never on the GUI thread
+        return self.device_wavelengths[key]
 
     def select_folder(self):
         folder = QFileDialog.getExistingDirectory(self, "Select Destination Folder")
@@ -390,6 +781,10 @@ class SpectrometerApp(QMainWindow):
                     self.show_alert("Select destination folder first.")
                     return
 
+                if self.spectrometer is None or self.ax is None:
+                    self.show_alert("No spectrometer connected.")
+                    return
+
                 self.file_name = self.file_name_input.text()
                 try:
                     self.integration_time = float(self.integration_time_input.text())
@@ -406,70 +801,585 @@ class SpectrometerApp(QMainWindow):
                 else:
                     num_measurements = None
 
-                if self.measurement_thread is not None:
-                    self.stop_measurement()
+                self.schedule = None
+                if self.sweep_input.text().strip():
+                    try:
+                        frames_per_step = int(self.frames_per_step_input.text())
+                    except ValueError:
+                        self.show_alert("Frames per step value is wrong!. Check Please!")
+                        return
+                    try:
+                        sweep = parse_sweep(self.sweep_input.text())
+                    except ValueError as e:
+                        self.show_alert(f"Sweep values are wrong!. {e}")
+                        return
+                    if frames_per_step < 1:
+                        self.show_alert("Frames per step must be at least 1.")
+                        return
+                    self.schedule = [(t, frames_per_step) for t in sweep]
+                    self.integration_time = sweep[0]
+                    num_measurements = None
+                exposure_target = None
+                if self.auto_exposure_checkbox.isChecked():
+                    try:
+                        exposure_target = float(self.exposure_target_input.text())
+                    except ValueError:
+                        self.show_alert("Exposure target value is wrong!. Check Please!")
+                        return
+                    if not (10 <= exposure_target <= 95):
+                        self.show_alert("Exposure target must be between 10 and 95 %.")
+                        return
+                    if self.schedule:
+                        self.show_alert("Auto exposure cannot be combined with a sweep.")
+                        return
+                self.run_total = sum(f for _, f in self.schedule) if self.schedule else num_measurements
+
+                mode = self.acquisition_mode_combo.currentText()
+                period = None
+                if mode == "fixed-rate":
+                    try:
+                        period = float(self.period_input.text())
+                    except ValueError:
+                        self.show_alert("Period value is wrong!. Check Please!")
+                        return
+                    if period < (max(t for t, _ in self.schedule) if self.schedule else self.integration_time):
+                        self.show_alert("Period must be at least the integration time.")
+                        return
+                    period /= 1000
+
+                try:
+                    scans_to_average = int(self.scans_to_average_input.text())
+                    boxcar_width = int(self.boxcar_width_input.text())
+                except ValueError:
+                    self.show_alert("Averaging values are wrong!. Check Please!")
+                    return
+                if scans_to_average < 1 or boxcar_width < 0:
+                    self.show_alert("Scans to average must be at least 1 and boxcar width at least 0.")
+                    return
+
+                try:
+                    buffer_depth = int(self.buffer_depth_input.text())
+                except ValueError:
+                    self.show_alert("Buffer depth value is wrong!. Check Please!")
+                    return
+                if buffer_depth < 1:
+                    self.show_alert("Buffer depth must be at least 1 frame.")
+                    return
+
+                try:
+                    refresh_interval = int(self.refresh_interval_input.text())
+                except ValueError:
+                    self.show_alert("Refresh interval value is wrong!. Check Please!")
+                    return
+
+                if self.all_devices_checkbox.isChecked():
+                    keys = list(self.device_handles)
+                else:
+                    keys = [self.device_key]
+
+                processing = self.processing_combo.currentText()
+                if (self.schedule or exposure_target is not None) and processing != "raw":
+                    self.show_alert("Sweeps and auto exposure are recorded raw: dark/reference spectra depend on the integration time.")
+                    return
+                corrections = {}
+                if processing != "raw":
+                    for key in keys:
+                        dark = self.background_for("dark", key)
+                        reference = self.background_for("reference", key)
+                        try:
+                            corrections[key] = Correction(processing, dark, reference)
+                        except ValueError as e:
+                            self.show_alert(f"{key}: {e}" if len(keys) > 1 else str(e))
+                            return
+
+                bands = None
+                band_integrators = {}
+                if self.kinetics_checkbox.isChecked():
+                    try:
+                        bands = parse_bands(self.bands_input.text())
+                        for key in keys:
+                            band_integrators[key] = BandIntegrator(self.wavelengths_for(key), bands)
+                    except ValueError as e:
+                        self.show_alert(f"Band values are wrong!. {e}")
+                        return
+
+                if self.capture_thread is not None:
+                    self.show_alert("Background capture in progress.")
+                    return
 
                 self.is_measuring = True
                 self.measurement_counter = 0
-                self.data = []
-                self.wavelengths = []
-                self.measurement_thread = MeasurementThread(self.spectrometer, self.integration_time, num_measurements)
-                self.measurement_thread.measurementFinished.connect(self.process_measurement)
-                self.measurement_thread.start()
+                self.dropped_frames = 0
+                self.display_timer.start(max(refresh_interval, 1))
+                self.rate_mark = (time.perf_counter(), 0)
+                # every device gets its own buffer, writer and thread, so they acquire in parallel
+                self.runs = {}
+                for key in keys:
+                    spectrometer = self.device_handles[key]
+                    wavelengths = self.wavelengths_for(key)
+                    averager = None
+                    if scans_to_average > 1 or boxcar_width > 0:
+                        averager = ScanAverager(spectrometer.pixels, scans_to_average, boxcar_width)
+                    writer = self.start_writer(key, wavelengths, len(keys) > 1)
+                    settings = dict(num_measurements=num_measurements, writer=writer, mode=mode, period=period,
+                                    averager=averager, correction=corrections.get(key), source=key,
+                                    schedule=self.schedule, qc=FrameQC(spectrometer.pixels))
+                    if exposure_target is not None:
+                        settings["auto_exposure"] = AutoExposure(spectrometer.pixels, exposure_target / 100)
+                    if self.track_peaks_checkbox.isChecked():
+                        settings["peak_tracker"] = PeakTracker(wavelengths, MAX_PEAKS)
+                    if bands is not None:
+                        settings["band_integrator"] = band_integrators[key]
+                    self.runs[key] = DeviceRun(key, spectrometer, wavelengths, RingBuffer(buffer_depth, spectrometer.pixels),
+                                               writer, settings, self.line_for(key))
+                    if bands is not None:
+                        self.runs[key].history = DecimatedHistory(4096, len(bands))
+                    if self.waterfall_checkbox.isChecked():
+                        self.start_waterfall(self.runs[key])
+                self.pending_saves = sum(run.writer is not None for run in self.runs.values())
+                self.saves_ok = True
+                self.show_peaks(None)
+                self.set_kinetics_view(bands)
+                self.set_waterfall_view(self.waterfall_checkbox.isChecked())
+                self.arrange_panels()
+                self.set_processing_axes(processing)
+                self.device_monitor.pause()
+                for run in self.runs.values():
+                    self.start_measurement_thread(run)
                 self.update_ui_state()
 
+    def start_measurement_thread(self, run):
+        settings = dict(run.settings)
+        if settings["num_measurements"] is not None:
+            settings["num_measurements"] -= run.counter
+        if settings["schedule"] is not None:
+            settings["schedule"] = skip_frames(settings["schedule"], run.counter)
+        integration_time = self.integration_time
+        if settings.get("auto_exposure") is not None and run.latest_frame is not None:
+            integration_time = run.latest_frame.integration_time  # resume from the converged exposure
+        run.thread = MeasurementThread(run.spectrometer, run.buffer, integration_time,
+                                       start_index=run.counter, **settings)
+        run.thread.measurementFinished.connect(self.process_measurement)
+        run.thread.measurementFailed.connect(self.measurement_failed)
+        run.thread.start()
+        self.device_monitor.set_busy(k for k, r in self.runs.items() if r.thread is not None)
+
+    @pyqtSlot(object, str)
+    def measurement_failed(self, key, message):
+        # keep the run (buffer, writer, counters) and wait for the device to come back;
+        # the other devices keep acquiring meanwhile. GUI thread only and no mutex: this can be
+        # delivered while stop_measurement's dialog runs; the is_measuring/thread checks cover that
+        run = self.runs.get(key)
+        if not self.is_measuring or run is None or run.thread is None:
+            return
+        run.thread.wait()
+        run.thread.deleteLater()
+        run.thread = None
+        self.reconnecting.add(key)
+        if key == self.device_key:
+            self.device_name_label.setText("Device: reconnecting...")
+        # other devices may still be acquiring: the monitor leaves their (busy) handles alone
+        self.device_monitor.set_busy(k for k, r in self.runs.items() if r.thread is not None)
+        self.device_monitor.invalidate(key)
+        self.device_monitor.pause(False)
+
+    def resume_measurement(self, key, spectrometer):
+        self.reconnecting.discard(key)
+        run = self.runs.get(key)
+        if not self.is_measuring or run is None or run.thread is not None:
+            return
+        if not self.reconnecting:
+            self.device_monitor.pause()
+        run.spectrometer = spectrometer
+        if run.settings["averager"] is not None:
+            run.settings["averager"].reset()
+        self.start_measurement_thread(run)
+
+    def background_for(self, kind, key):
+        # dark/reference spectra only apply to the device and integration time they were captured with
+        background = (self.dark_spectrum if kind == "dark" else self.reference_spectrum).get(key)
+        if background is None or background[0] != self.integration_time:
+            return None
+        return background[1]
+
+    def update_background_label(self):
+        dark = self.dark_spectrum.get(self.device_key)
+        reference = self.reference_spectrum.get(self.device_key)
+        dark = f"{dark[0]} ms" if dark is not None else "none"
+        reference = f"{reference[0]} ms" if reference is not None else "none"
+        self.background_label.setText(f"Dark: {dark} | Reference: {reference}")
+
+    def capture_background(self, kind):
+        if self.is_measuring or self.capture_thread is not None:
+            self.show_alert("Stop the measurement before capturing a background.")
+            return
+        if self.spectrometer is None:
+            self.show_alert("No spectrometer connected.")
+            return
+        try:
+            integration_time = float(self.integration_time_input.text())
+            frames = int(self.background_frames_input.text())
+        except ValueError:
+            self.show_alert("Integration time or frames value is wrong!. Check Please!")
+            return
+        if not (3.8 <= integration_time <= 10000) or frames < 1:
+            self.show_alert("Integration time must be between 3.8 and 10000 and frames at least 1.")
+            return
+        # reuse the acquisition thread: N scans averaged into a single frame
+        self.capture_kind = kind
+        self.capture_key = self.device_key
+        self.capture_integration_time = integration_time
+        buffer = RingBuffer(1, self.spectrometer.pixels)
+        averager = ScanAverager(self.spectrometer.pixels, frames)
+        self.device_monitor.pause()
+        self.capture_thread = MeasurementThread(self.spectrometer, buffer, integration_time, 1, averager=averager)
+        self.capture_thread.measurementFinished.connect(self.background_captured)
+        self.capture_thread.finished.connect(self.background_capture_finished)
+        self.capture_thread.start()
+
+    @pyqtSlot(object)
+    def background_captured(self, frame):
+        spectrum = (self.capture_integration_time, np.array(frame.data, dtype=float))
+        if self.capture_kind == "dark":
+            self.dark_spectrum[self.capture_key] = spectrum
+        else:
+            self.reference_spectrum[self.capture_key] = spectrum
+        self.update_background_label()
+
+    def background_capture_finished(self):
+        self.capture_thread.deleteLater()
+        self.capture_thread = None
+        self.device_monitor.pause(False)
+
+    def set_processing_axes(self, processing):
+        if processing == "transmission":
+            self.ax.set_ylabel('Transmission')
+            self.ax.set_ylim([0, 1.2])
+        elif processing == "absorbance":
+            self.ax.set_ylabel('Absorbance')
+            self.ax.set_ylim([-0.1, 3])
+        else:
+            self.ax.set_ylabel('Intensity')
+            self.ax.set_ylim([self.ylim_min_slider.value(), self.ylim_max_slider.value()])
+        # overlay: show the lines of the devices in this run, with a legend when there are several
+        for key, line in self.lines.items():
+            line.set_visible(key in self.runs)
+        if self.ax.get_legend() is not None:
+            self.ax.get_legend().remove()
+        if len(self.runs) > 1:
+            self.ax.legend([run.line for run in self.runs.values()], list(self.runs), loc='upper right')
+        self.live_plot.clear_traces()
+        self.redraw_layout()
+
+    def line_for(self, key):
+        if key not in self.lines:
+            color = LINE_COLORS[len(self.lines) % len(LINE_COLORS)]
+            self.lines[key], = self.ax.plot([], [], color=color, animated=True)
+            from matplotlib.colors import to_hex
+            self.live_colors[key] = to_hex(color)
+        return self.lines[key]
+
     def update_ui_state(self):
         if self.is_measuring:
             self.start_button.setEnabled(False)
             self.stop_button.setEnabled(True)
+            self.device_combo.setEnabled(False)
+            self.all_devices_checkbox.setEnabled(False)
         else:
             self.start_button.setEnabled(True)
             self.stop_button.setEnabled(False)
+            self.device_combo.setEnabled(True)
+            self.all_devices_checkbox.setEnabled(True)
 
     def stop_measurement(self):
             with QMutexLocker(self.mutex):
-                if self.is_measuring:
+                stopped = self.is_measuring
+                if stopped:
                     self.is_measuring = False
-                    self.measurement_thread.stop()
-                    self.measurement_thread.wait()
-                    self.measurement_thread.deleteLater()
-                    self.measurement_thread = None
+                    for run in self.runs.values():
+                        if run.thread is not None:
+                            if not run.thread.stop():
+                                self.device_monitor.invalidate(run.key)  # closed to unblock it: reopen
+                            if run.thread.isRunning():
+                                run.thread.finished.connect(run.thread.deleteLater)
+                            else:
+                                run.thread.deleteLater()
+                            run.thread = None
+                    self.reconnecting.clear()
+                    self.device_monitor.waiting.clear()
+                    self.device_monitor.set_busy(())
+                    self.device_monitor.pause(False)
+                    self.display_timer.stop()
+                    self.render_display()
                     self.update_ui_state()
-                    QMessageBox.information(self, "Measurement Finished", "Measurement finished successfully.")
-
-                    if self.save_file_radio.isChecked():
-                        if self.save_data():
-                            self.show_alert("Measurement finished. Data saved successfully.")
-                            self.data_saved = True
-                        else:
-                            self.show_alert("Measurement finished. Error occurred while saving the data.")
-                            self.data_saved = False
+                    for run in self.runs.values():
+                        if run.writer is not None:
+                            # the writer finishes the file in the background and reports via saveFinished
+                            run.writer.close(extras={"hot_pixels": run.settings["qc"].hot_pixels()})
+                            self.closing_writers.append(run.writer)
+                            run.writer = None
+                    self.closing_writers = [writer for writer in self.closing_writers if writer.is_alive()]
+            # the dialog runs a nested event loop: never hold the mutex across it
+            if stopped:
+                QMessageBox.information(self, "Measurement Finished", "Measurement finished successfully.")
 
     
-    @pyqtSlot(list)
-    def process_measurement(self, measurement_data):
-        wavelengths, intensities = measurement_data
-        self.data.append(intensities.copy())  # add a copy of intensity list
-        self.wavelengths = wavelengths
-
-        self.ax.clear()
-        self.ax.plot(wavelengths, intensities, color='tab:blue', label=f"Measure:{self.measurement_counter}")
-        self.ax.set_xlabel('Wavelength (nm)')
-        self.ax.set_ylabel('Intensity')
-        self.ax.set_xlim([self.xlim_min_slider.value(), self.xlim_max_slider.value()])
-        self.ax.set_ylim([self.ylim_min_slider.value(), self.ylim_max_slider.value()])
-        self.fig.tight_layout()
-        self.canvas.draw()
-
+    @pyqtSlot(object)
+    def process_measurement(self, frame):
+        # frame.data already lives in the device's ring buffer, written by its acquisition thread
+        run = self.runs.get(frame.source)
+        if run is None:
+            return
+        run.latest_frame = frame
+        if self.display_average_checkbox.isChecked():
+            np.add(run.display_sum, frame.data, out=run.display_sum)
+        run.pending_frames += 1
+        run.counter += 1
+        saturated, spikes, run.hot_pixels = frame.qc
+        run.saturated_frames += saturated > 0
+        run.spikes += spikes
+        if frame.bands is not None and run.history is not None:
+            if run.t0 is None:
+                run.t0 = frame.timestamp
+            run.history.append(frame.timestamp - run.t0, frame.bands)
+        if run.waterfall is not None:
+            if run.t0 is None:
+                run.t0 = frame.timestamp
+            np.add.reduceat(frame.data, run.waterfall_edges, out=run.waterfall_row)
+            np.divide(run.waterfall_row, run.waterfall_bins, out=run.waterfall_row)
+            run.waterfall.append(frame.timestamp - run.t0, run.waterfall_row)
         self.measurement_counter += 1
-        self.measurement_counter_label.setText(f"Measurements: {self.measurement_counter}")
-        self.update()
 
-        if self.num_measurements_checkbox.isChecked() and self.measurement_counter >= int(self.num_measurements_input.text()):
+        if (self.run_total is not None and self.is_measuring
+                and all(r.counter >= self.run_total for r in self.runs.values())):
             QTimer.singleShot(0, self.stop_measurement)
             QMessageBox.information(self, "Measurement Finished", "Measurement finished successfully.")
 
             
+    def render_display(self):
+        # draw only the newest frame of each device (or the mean of its frames since the last tick)
+        updated = False
+        for run in self.runs.values():
+            if not run.pending_frames:
+                continue
+            if self.display_average_checkbox.isChecked():
+                np.divide(run.display_sum, run.pending_frames, out=run.display_frame)
+                run.display_sum[:] = 0
+            else:
+                run.display_frame[:] = run.latest_frame.data
+            self.set_trace(run)
+            self.dropped_frames += run.pending_frames - 1
+            run.pending_frames = 0
+            updated = True
+        if not updated:
+            return
+        run = self.runs.get(self.device_key) or next(iter(self.runs.values()))
+        frame = run.latest_frame
+        if self.renderer == "live":
+            # kinetics and waterfall keep recording and are drawn by the publication view
+            self.live_plot.set_peaks(frame.peaks if frame is not None else None)
+            self.live_plot.update()
+        else:
+            self.show_peaks(frame.peaks if frame is not None else None)
+            rescaled = self.update_kinetics(run)
+            rescaled = self.update_waterfall(run) or rescaled
+            if rescaled:
+                self.canvas.draw()  # a chart outgrew its limits
+            else:
+                self.blit_lines()
+        if frame is not None:
+            if frame.integration_time is not None:
+                self.exposure_label.setText(f"{frame.integration_time:g} ms")
+            self.qc_label.setText(f"QC: saturated frames {run.saturated_frames} | spikes {run.spikes} | "
+                                  f"hot pixels {run.hot_pixels}")
+            self.qc_label.setStyleSheet("color: red;" if frame.qc[0] else "")
+
+        self.measurement_counter_label.setText(f"Measurements: {self.measurement_counter}")
+        now = time.perf_counter()
+        mark_time, mark_count = self.rate_mark
+        if now - mark_time >= 1.0:
+            self.rate_label.setText(f"Rate: {(self.measurement_counter - mark_count) / (now - mark_time):.1f} spectra/s")
+            self.rate_mark = (now, self.measurement_counter)
+        self.dropped_frames_label.setText(f"Dropped (display only): {self.dropped_frames}")
+
+    def on_draw(self, event):
+        # full redraws (resize, limits, toolbar) refresh the cached background
+        self.background = self.canvas.copy_from_bbox(self.fig.bbox)
+        self.draw_lines()
+
+    def on_resize(self, event):
+        self.fig.tight_layout()
+        self.refresh_traces()
+
+    def set_trace(self, run):
+        # min/max per screen pixel of the visible range; the bins only change with the range or plot width
+        if self.renderer == "live":
+            xmin, xmax = self.live_plot.xlim
+            run.decimator.set_view(xmin, xmax, self.live_plot.plot_width())
+            x, y = run.decimator.decimate(run.display_frame)
+            self.live_plot.set_trace(run.key, x, y, self.live_colors[run.key])
+            return
+        xmin, xmax = self.ax.get_xlim()
+        run.decimator.set_view(xmin, xmax, max(int(self.ax.bbox.width), 1))
+        run.line.set_data(*run.decimator.decimate(run.display_frame))
+
+    def refresh_traces(self, ax=None):
+        # zoom, pan or resize: re-decimate what is on screen, even when not measuring
+        for run in self.runs.values():
+            if run.latest_frame is not None:
+                self.set_trace(run)
+        if self.renderer == "live":
+            self.live_plot.update()
+
+    def set_renderer(self, renderer):
+        self.renderer = renderer
+        if self.ax is None:
+            return  # setup_plot applies it
+        live = renderer == "live"
+        self.canvas.setVisible(not live)
+        self.toolbar.setVisible(not live)
+        self.live_plot.setVisible(live)
+        self.live_toolbar.setVisible(live)
+        self.refresh_traces()  # the traces of the hidden view were not kept up to date
+        self.redraw_layout()
+
+    def live_limits_changed(self, xmin, xmax, ymin, ymax):
+        # zoom/pan in the live plot: the matplotlib axes keep the limits for the publication view
+        self.ax.set_xlim(xmin, xmax)
+        self.ax.set_ylim(ymin, ymax)
+
+    def show_peaks(self, peaks):
+        # peaks: (MAX_PEAKS, 3) centroid nm, FWHM nm, height, NaN rows for missing peaks
+        if peaks is None:
+            peaks = np.full((MAX_PEAKS, 3), np.nan)
+        found = ~np.isnan(peaks[:, 0])
+        self.peak_markers.set_data(peaks[found, 0], peaks[found, 2])
+        for label, (center, fwhm, height), ok in zip(self.peak_labels, peaks, found):
+            label.set_visible(bool(ok))
+            if ok:
+                label.set_position((center, height))
+                label.set_text(f"{center:.1f} nm\nFWHM {fwhm:.1f}")
+
+    def arrange_panels(self):
+        # spectrum on top, then the waterfall and kinetics panels that are shown
+        waterfall = self.waterfall_ax.get_visible()
+        kinetics = self.kinetics_ax.get_visible()
+        if waterfall and kinetics:
+            self.ax.set_subplotspec(self.grid[:3, 0])
+            self.waterfall_ax.set_subplotspec(self.grid[3:5, 0])
+            self.kinetics_ax.set_subplotspec(self.grid[5, 0])
+        elif waterfall or kinetics:
+            self.ax.set_subplotspec(self.grid[:4, 0])
+            self.waterfall_ax.set_subplotspec(self.grid[4:, 0])
+            self.kinetics_ax.set_subplotspec(self.grid[4:, 0])
+        else:
+            self.ax.set_subplotspec(self.grid[:, 0])
+        # with the waterfall underneath, only the lowest panel needs wavelength labels
+        self.ax.xaxis.label.set_visible(not waterfall)
+        self.ax.tick_params(axis='x', labelbottom=not waterfall)
+        self.waterfall_ax.set_xlabel('Wavelength (nm)')
+
+    def start_waterfall(self, run):
+        # at most 1024 columns (pixels averaged in equal bins) and 512 rows; longer
+        # runs average neighbouring rows, so memory and cost per frame stay fixed
+        columns = min(len(run.wavelengths), 1024)
+        run.waterfall_edges = np.linspace(0, len(run.wavelengths), columns + 1).astype(np.intp)[:-1]
+        run.waterfall_bins = np.diff(run.waterfall_edges, append=len(run.wavelengths))  # pixels per column
+        run.waterfall_row = np.zeros(columns)
+        run.waterfall = DecimatedHistory(512, columns)
+
+    def set_waterfall_view(self, shown):
+        self.waterfall_ax.set_visible(shown)
+        if shown:
+            self.waterfall_image.set_data(np.zeros((1, 1)))
+            self.waterfall_ax.set_ylim(0, 10)
+
+    def update_waterfall(self, run):
+        history = run.waterfall
+        if history is None or not history.count or not self.waterfall_ax.get_visible():
+            return False
+        top = history.times[history.count - 1]
+        self.waterfall_image.set_data(history.values[:history.count])
+        self.waterfall_image.set_extent((run.wavelengths[0], run.wavelengths[-1], 0, max(top, 1e-3)))
+        self.waterfall_image.set_clim(*self.ax.get_ylim())
+        if top > self.waterfall_ax.get_ylim()[1]:
+            self.waterfall_ax.set_ylim(0, top * 1.5)
+            return True
+        return False
+
+    def set_kinetics_view(self, bands):
+        if bands is None:
+            self.kinetics_ax.set_visible(False)
+            return
+        self.kinetics_ax.set_visible(True)
+        while len(self.kinetics_lines) < len(bands):
+            color = LINE_COLORS[len(self.kinetics_lines) % len(LINE_COLORS)]
+            self.kinetics_lines.append(self.kinetics_ax.plot([], [], color=color, animated=True)[0])
+        for i, line in enumerate(self.kinetics_lines):
+            line.set_data([], [])
+            line.set_visible(i < len(bands))
+            if i < len(bands):
+                line.set_label(f"{bands[i][0]:g}-{bands[i][1]:g} nm")
+        self.kinetics_ax.legend(handles=self.kinetics_lines[:len(bands)], loc='lower right', fontsize=9)
+        self.kinetics_ax.set_xlim(0, 10)
+        self.kinetics_ax.set_ylim(0, 1)
+
+    def update_kinetics(self, run):
+        # The history holds at most a few thousand points, so this costs the same
+        # after a million frames as after ten. Limits grow in steps (x by half
+        # again), so full redraws stay rare and the chart is otherwise blitted.
+        history = run.history
+        if history is None or not history.count or not self.kinetics_ax.get_visible():
+            return False
+        times = history.times[:history.count]
+        values = history.values[:history.count]
+        for i, line in enumerate(self.kinetics_lines[:values.shape[1]]):
+            line.set_data(times, values[:, i])
+        rescaled = False
+        if times[-1] > self.kinetics_ax.get_xlim()[1]:
+            self.kinetics_ax.set_xlim(0, times[-1] * 1.5)
+            rescaled = True
+        lo, hi = values.min(), values.max()
+        y0, y1 = self.kinetics_ax.get_ylim()
+        if lo < y0 or hi > y1:
+            margin = 0.2 * max(hi - lo, abs(hi), 1e-9)
+            self.kinetics_ax.set_ylim(min(y0, lo - margin) if lo < y0 else y0, max(y1, hi + margin))
+            rescaled = True
+        return rescaled
+
+    def draw_lines(self):
+        for line in self.lines.values():
+            if line.get_visible():
+                self.ax.draw_artist(line)
+        if self.waterfall_ax.get_visible():
+            self.waterfall_ax.draw_artist(self.waterfall_image)
+        if self.kinetics_ax.get_visible():
+            for line in self.kinetics_lines:
+                if line.get_visible():
+                    self.kinetics_ax.draw_artist(line)
+        self.ax.draw_artist(self.peak_markers)
+        for label in self.peak_labels:
+            if label.get_visible():
+                self.ax.draw_artist(label)
+
+    def blit_lines(self):
+        if self.background is None:
+            self.canvas.draw()
+            return
+        self.canvas.restore_region(self.background)
+        self.draw_lines()
+        self.canvas.blit(self.fig.bbox)
+
+    def redraw_layout(self):
+        if self.renderer == "live":
+            # the live plot mirrors the limits and label set on the matplotlib axes
+            self.live_plot.set_ylabel(self.ax.get_ylabel())
+            self.live_plot.set_limits(self.ax.get_xlim(), self.ax.get_ylim(), home=True)
+            self.refresh_traces()
+            return
+        self.fig.tight_layout()
+        self.canvas.draw()
+
     def stop_button_clicked(self):
         if self.num_measurements_checkbox.isChecked():
             self.stop_measurement()
@@ -493,38 +1403,62 @@ class SpectrometerApp(QMainWindow):
         
     def update_xlim(self, value):
         try:
-            if self.ax.lines:
+            if self.ax is not None:
                 xmin = self.xlim_min_slider.value()
                 xmax = self.xlim_max_slider.value()
                 self.ax.set_xlim([xmin, xmax])
-                self.canvas.draw()
+                self.redraw_layout()
         except IndexError:
             pass
 
 
     def update_ylim(self, value):
         try:
-            if self.ax.lines:
+            if self.ax is not None:
                 self.ax.set_ylim([self.ylim_min_slider.value(), self.ylim_max_slider.value()])
-                self.canvas.draw()
+                self.redraw_layout()
         except IndexError:
             pass
 
 
-    def save_data(self):
-        if self.data and self.save_file_radio.isChecked():
-            self.file_name_data = save_file_with_number(self.file_name, int(self.integration_time), self.file_path)
-            try:
-                with open(self.file_name_data, "w", newline="") as csvfile:
-                    writer = csv.writer(csvfile)
-                    writer.writerow(["Wavelength (nm)"] + [f"m-{i}" for i in range(len(self.data))])
-                    writer.writerows(zip(self.wavelengths, *self.data))
-                return True
-            except IOError:
-                return False
+    def start_writer(self, key, wavelengths, multiple=False):
+        if not self.save_file_radio.isChecked():
+            return None
+        spectrometer = self.device_handles[key]
+        sink_class = SINKS[self.file_format_combo.currentData()]
+        # one file per device, named after its serial when several are recorded
+        name = f"{self.file_name}-{key}" if multiple else self.file_name
+        if self.schedule:
+            label = f"{int(self.schedule[0][0])}-{int(self.schedule[-1][0])}"
         else:
-            return False
-        
+            label = int(self.integration_time)
+        self.file_name_data = save_file_with_number(name, label, self.file_path, sink_class.ext)
+        info = {"model": spectrometer.model, "serial": spectrometer.serial_number,
+                "scans_to_average": int(self.scans_to_average_input.text()), "boxcar_width": int(self.boxcar_width_input.text()),
+                "processing": self.processing_combo.currentText()}
+        for kind in ("dark", "reference"):
+            background = self.background_for(kind, key)
+            if background is not None:
+                info[kind] = background
+        if self.schedule:
+            info["schedule"] = np.array(self.schedule)  # (integration time, frames) per step
+        sink = sink_class(self.file_name_data, wavelengths, info)
+        writer = StreamWriter(sink, on_finished=self.saveFinished.emit)
+        writer.start()
+        return writer
+
+    @pyqtSlot(bool)
+    def data_saved(self, ok):
+        # one report once every device's file is finished
+        self.saves_ok = self.saves_ok and ok
+        self.pending_saves -= 1
+        if self.pending_saves > 0:
+            return
+        if self.saves_ok:
+            self.show_alert("Measurement finished. Data saved successfully.")
+        else:
+            self.show_alert("Measurement finished. Error occurred while saving the data.")
+
     def exit_application(self):
         if self.is_measuring:
             confirm_exit = QMessageBox.question(
@@ -542,6 +1476,29 @@ class SpectrometerApp(QMainWindow):
             if confirm_exit == QMessageBox.Yes:
                 self.close()  # Cerrar la ventana principal
     
+    def closeEvent(self, event):
+        if self.is_measuring:
+            self.stop_measurement()
+        self.wait_for_writers()  # the writer threads are daemons: exiting now would cut the files short
+        self.device_monitor.stop()
+        super().closeEvent(event)
+
+    def wait_for_writers(self):
+        writers = [writer for writer in self.closing_writers if writer.is_alive()]
+        if not writers:
+            return
+        progress = QProgressDialog("Finishing saved files...", None, 0, len(writers), self)
+        progress.setWindowTitle("Saving")
+        progress.setWindowModality(Qt.WindowModal)
+        progress.setMinimumDuration(0)
+        for done, writer in enumerate(writers):
+            progress.setValue(done)
+            while writer.is_alive():
+                QApplication.processEvents()
+                writer.join(0.05)
+        progress.setValue(len(writers))
+        self.closing_writers = []
+
     def show_alert(self, message):
         alert = QMessageBox()
         alert.setIcon(QMessageBox.Information)
@@ -551,7 +1508,20 @@ class SpectrometerApp(QMainWindow):
             
             
 if __name__ == "__main__":
-    app = QApplication(sys.argv)
-    window = SpectrometerApp()
+    parser = argparse.ArgumentParser(description="IICO-Spectra")
+    parser.add_argument("--backend", choices=list(BACKENDS), default="seabreeze", help="device backend")
+    parser.add_argument("--replay", help="CSV saved by the app to replay with the simulated backend")
+    parser.add_argument("--profile-startup", action="store_true", help="print an import/initialization timing breakdown")
+    args, qt_args = parser.parse_known_args()
+    if args.backend == "simulated":
+        backend = BACKENDS["simulated"](replay=args.replay)
+    else:
+        backend = BACKENDS[args.backend]()
+    app = QApplication(sys.argv[:1] + qt_args)
+    startup_mark("QApplication")
+    window = SpectrometerApp(backend)
     window.show()
+    if args.profile_startup:
+        # discovery runs in the device monitor thread and may finish after the plot
+        window.startupFinished.connect(print_startup_profile)
     sys.exit(app.exec_())
\ No newline at end of file
@@ -0,0 +1,130 @@
+# Headless acquisition: streams spectra straight to disk, no Qt or matplotlib.
+#
+#   python ispectra_cli.py -t 100 -n 5000 --file-name exp --output-dir /data --scans 10
+import os
+import sys
+import time
+import argparse
+
+from acquisition import Acquisition, ACQUISITION_MODES, parse_sweep
+from devices import BACKENDS
+from processing import ScanAverager, AutoExposure, FrameQC, PeakTracker
+from storage import RingBuffer, StreamWriter, SINKS, MAX_PEAKS, save_file_with_number
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="IICO-Spectra headless acquisition")
+    parser.add_argument("-t", "--integration-time", type=float, default=3.8, help="ms [3.8 <= t <= 10000]")
+    parser.add_argument("--sweep", help="exposure series in ms, e.g. 10:100:10 or 10,20,50 (overrides -t and -n)")
+    parser.add_argument("--frames-per-step", type=int, default=10, help="frames per sweep step")
+    parser.add_argument("-n", "--num-measurements", type=int, default=None, help="frames to save (default: until Ctrl+C)")
+    parser.add_argument("--auto-exposure", action="store_true", help="adjust the integration time, starting from -t")
+    parser.add_argument("--target", type=float, default=80, help="auto-exposure peak level in %% of full scale")
+    parser.add_argument("--track-peaks", action="store_true", help="save centroid/FWHM of up to 3 peaks per frame")
+    parser.add_argument("--file-name", default="exp")
+    parser.add_argument("--output-dir", default=".")
+    parser.add_argument("--format", choices=list(SINKS), default="csv")
+    parser.add_argument("--scans", type=int, default=1, help="scans averaged into each saved frame")
+    parser.add_argument("--boxcar", type=int, default=0, help="boxcar half-width in pixels")
+    parser.add_argument("--mode", choices=list(ACQUISITION_MODES), default="free-run")
+    parser.add_argument("--period", type=float, default=None, help="ms between frames in fixed-rate mode")
+    parser.add_argument("--backend", choices=list(BACKENDS), default="seabreeze")
+    parser.add_argument("--replay", help="CSV to replay with the simulated backend")
+    parser.add_argument("--device", type=int, default=0, help="index in the device list")
+    parser.add_argument("-q", "--quiet", action="store_true")
+    args = parser.parse_args(argv)
+    if not (3.8 <= args.integration_time <= 10000):
+        parser.error("integration time must be between 3.8 and 10000 ms")
+    args.schedule = None
+    if args.sweep is not None:
+        try:
+            sweep = parse_sweep(args.sweep)
+        except ValueError as e:
+            parser.error(str(e))
+        if args.frames_per_step < 1:
+            parser.error("frames per step must be at least 1")
+        args.schedule = [(t, args.frames_per_step) for t in sweep]
+        args.integration_time = sweep[0]
+    if args.auto_exposure and (args.schedule or not (10 <= args.target <= 95)):
+        parser.error("auto exposure needs a --target between 10 and 95 and cannot be combined with --sweep")
+    if args.scans < 1 or args.boxcar < 0:
+        parser.error("scans must be at least 1 and boxcar at least 0")
+    longest = max(t for t, _ in args.schedule) if args.schedule else args.integration_time
+    if args.mode == "fixed-rate" and (args.period is None or args.period < longest):
+        parser.error("fixed-rate mode needs --period of at least the integration time")
+    if not os.path.isdir(args.output_dir):
+        parser.error(f"output directory does not exist: {args.output_dir}")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.backend == "simulated":
+        backend = BACKENDS["simulated"](replay=args.replay)
+    else:
+        backend = BACKENDS[args.backend]()
+    devices = backend.list_devices()
+    if len(devices) <= args.device:
+        print("No spectrometers found connected. Please check the connection and try again.", file=sys.stderr)
+        return 1
+    spectrometer = backend.open(devices[args.device])
+
+    wavelengths = spectrometer.wavelengths()
+    sink_class = SINKS[args.format]
+    label = f"{int(args.schedule[0][0])}-{int(args.schedule[-1][0])}" if args.schedule else int(args.integration_time)
+    file_name = save_file_with_number(args.file_name, label, args.output_dir, sink_class.ext)
+    info = {"model": spectrometer.model, "serial": spectrometer.serial_number,
+            "scans_to_average": args.scans, "boxcar_width": args.boxcar, "processing": "raw"}
+    if args.schedule:
+        info["schedule"] = [list(step) for step in args.schedule]
+    saved = []
+    writer = StreamWriter(sink_class(file_name, wavelengths, info), on_finished=saved.append)
+    writer.start()
+
+    averager = None
+    if args.scans > 1 or args.boxcar > 0:
+        averager = ScanAverager(spectrometer.pixels, args.scans, args.boxcar)
+    auto_exposure = AutoExposure(spectrometer.pixels, args.target / 100) if args.auto_exposure else None
+    peak_tracker = PeakTracker(wavelengths, MAX_PEAKS) if args.track_peaks else None
+    period = args.period / 1000 if args.period is not None else None
+    # the buffer only hands frames to the writer; nothing is plotted
+    acquisition = Acquisition(spectrometer, RingBuffer(2, spectrometer.pixels), args.integration_time,
+                              args.num_measurements, writer, args.mode, period, averager=averager,
+                              schedule=args.schedule, auto_exposure=auto_exposure, qc=FrameQC(spectrometer.pixels),
+                              peak_tracker=peak_tracker)
+
+    progress = {"count": 0, "last": time.perf_counter(), "last_count": 0}
+
+    def report(frame):
+        progress["count"] += 1
+        now = time.perf_counter()
+        if not args.quiet and now - progress["last"] >= 1.0:
+            rate = (progress["count"] - progress["last_count"]) / (now - progress["last"])
+            print(f"\rMeasurements: {progress['count']}  Rate: {rate:.1f} spectra/s  "
+                  f"Integration time: {frame.integration_time:g} ms", end="", file=sys.stderr)
+            progress["last"], progress["last_count"] = now, progress["count"]
+
+    if not args.quiet:
+        print(f"Device: {spectrometer.model} ({spectrometer.serial_number}) -> {file_name}", file=sys.stderr)
+    try:
+        acquisition.run(report)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        writer.close(extras={"hot_pixels": acquisition.qc.hot_pixels()})
+        writer.join()
+        spectrometer.close()
+    if not args.quiet:
+        print(f"\nMeasurements: {progress['count']}", file=sys.stderr)
+    if not saved or not saved[0]:
+        print(f"Error occurred while saving the data: {writer.error}", file=sys.stderr)
+        return 1
+    if acquisition.error is not None:
+        # the frames read before the device failed are saved; report the cut-short run
+        print(f"Device error after {progress['count']} measurements: {acquisition.error}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,351 @@
+# Qt-native spectrum plot for the "live" renderer: traces are QPainter polylines
+# whose vertices are written straight into the QPolygonF memory with numpy, so a
+# repaint costs about a millisecond where a matplotlib blit costs several.
+import numpy as np
+
+from PyQt5.QtWidgets import QWidget, QHBoxLayout, QPushButton, QLabel, QFileDialog, QSizePolicy
+from PyQt5.QtCore import Qt, QPointF, QRectF, pyqtSignal
+from PyQt5.QtGui import QPainter, QPen, QColor, QPolygonF, QFont, QFontMetrics, QPixmap
+
+
+def nice_ticks(lo, hi, count=8):
+    # ticks at 1, 2 or 5 x 10^n, like matplotlib's default locator
+    span = hi - lo
+    if not np.isfinite(span) or span <= 0:
+        return []
+    raw = span / count
+    magnitude = 10 ** np.floor(np.log10(raw))
+    step = next(m * magnitude for m in (1, 2, 5, 10) if m * magnitude >= raw)
+    first = np.ceil(lo / step) * step
+    return [t for t in np.arange(first, hi + step / 2, step) if lo <= t <= hi]
+
+
+def tick_text(value, step):
+    decimals = max(0, -int(np.floor(np.log10(step)))) if step > 0 else 0
+    return f"{value:.{decimals}f}"
+
+
+class LivePlot(QWidget):
+    # Emitted with (xmin, xmax, ymin, ymax) when the user zooms or pans.
+    limitsChanged = pyqtSignal(float, float, float, float)
+    cursorMoved = pyqtSignal(str)
+    resized = pyqtSignal()
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setAttribute(Qt.WA_OpaquePaintEvent)
+        self.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Expanding)
+        self.setMouseTracking(True)
+        self.xlim = (0.0, 1.0)
+        self.ylim = (0.0, 1.0)
+        self.xlabel = "Wavelength (nm)"
+        self.ylabel = "Intensity"
+        self.traces = {}  # key -> [x, y, color, polygon]
+        self.peaks = None
+        self.mode = None  # "pan", "zoom" or None
+        self.drag = None
+        self.rubber = None
+        self.history = []  # views for home/back/forward, like the matplotlib toolbar
+        self.position = -1
+        self.tick_font = QFont(self.font())
+        self.tick_font.setPointSize(10)
+        self.label_font = QFont(self.tick_font)
+        self.label_font.setPointSize(12)
+        self.metrics = QFontMetrics(self.tick_font)
+        self.background = None  # axes, ticks and labels, redrawn only when the view changes
+
+    def plot_rect(self):
+        left = self.metrics.horizontalAdvance("000000") + 30
+        bottom = 2 * self.metrics.height() + 16
+        return QRectF(left, 10, max(self.width() - left - 15, 1), max(self.height() - bottom - 10, 1))
+
+    def plot_width(self):
+        return max(int(self.plot_rect().width()), 1)
+
+    def set_limits(self, xlim, ylim, home=False):
+        # home: limits chosen by the app (sliders, processing), which restart the view history
+        self.xlim = (float(xlim[0]), float(xlim[1]))
+        self.ylim = (float(ylim[0]), float(ylim[1]))
+        if home:
+            self.history = [(self.xlim, self.ylim)]
+            self.position = 0
+        self.background = None
+        self.update()
+
+    def set_ylabel(self, label):
+        if label != self.ylabel:
+            self.ylabel = label
+            self.background = None
+
+    def set_trace(self, key, x, y, color):
+        # x and y may be the decimator's reused arrays: they are read at paint time
+        trace = self.traces.get(key)
+        if trace is None:
+            trace = self.traces[key] = [None, None, QColor(color), QPolygonF()]
+        trace[0], trace[1] = x, y
+
+    def clear_traces(self):
+        self.traces.clear()
+        self.peaks = None
+        self.update()
+
+    def set_peaks(self, peaks):
+        self.peaks = peaks
+
+    def polygon(self, trace, rect):
+        x, y, _, poly = trace
+        n = len(x)
+        if poly.size() != n:
+            poly = trace[3] = QPolygonF(n)
+        ptr = poly.data()
+        ptr.setsize(16 * n)
+        points = np.frombuffer(ptr, dtype=np.float64).reshape(n, 2)
+        (x0, x1), (y0, y1) = self.xlim, self.ylim
+        sx = rect.width() / (x1 - x0)
+        sy = rect.height() / (y1 - y0)
+        np.subtract(x, x0, out=points[:, 0])
+        points[:, 0] *= sx
+        points[:, 0] += rect.left()
+        np.subtract(y, y0, out=points[:, 1])
+        points[:, 1] *= -sy
+        points[:, 1] += rect.bottom()
+        # keep far-off vertices (huge zoom) within what the rasterizer handles
+        np.clip(points, -1e6, 1e6, out=points)
+        return poly
+
+    def to_screen(self, x, y, rect):
+        (x0, x1), (y0, y1) = self.xlim, self.ylim
+        return QPointF(rect.left() + (x - x0) * rect.width() / (x1 - x0),
+                       rect.bottom() - (y - y0) * rect.height() / (y1 - y0))
+
+    def to_data(self, point, rect):
+        (x0, x1), (y0, y1) = self.xlim, self.ylim
+        return (x0 + (point.x() - rect.left()) * (x1 - x0) / rect.width(),
+                y0 + (rect.bottom() - point.y()) * (y1 - y0) / rect.height())
+
+    def draw_background(self, rect):
+        self.background = QPixmap(self.size())
+        self.background.fill(Qt.white)
+        painter = QPainter(self.background)
+        painter.setFont(self.tick_font)
+        self.draw_axes(painter, rect)
+        painter.end()
+
+    def paintEvent(self, event):
+        rect = self.plot_rect()
+        if self.background is None or self.background.size() != self.size():
+            self.draw_background(rect)
+        painter = QPainter(self)
+        painter.drawPixmap(0, 0, self.background)
+        painter.setFont(self.tick_font)
+        painter.save()
+        painter.setClipRect(rect)
+        for key, trace in self.traces.items():
+            if trace[0] is None or not len(trace[0]):
+                continue
+            # 1 px cosmetic pens take the rasterizer's fast path; wider pens are stroked as outlines
+            pen = QPen(trace[2], 1)
+            pen.setCosmetic(True)
+            painter.setPen(pen)
+            painter.drawPolyline(self.polygon(trace, rect))
+        self.draw_peaks(painter, rect)
+        painter.restore()
+        self.draw_legend(painter, rect)
+        if self.rubber is not None:
+            painter.setPen(QPen(Qt.black, 1, Qt.DashLine))
+            painter.drawRect(self.rubber)
+        painter.setPen(QPen(Qt.black, 1.5))
+        painter.drawRect(rect)
+        painter.end()
+
+    def draw_axes(self, painter, rect):
+        grid = QPen(QColor(0, 0, 0, 30), 1)
+        tick = QPen(Qt.black, 1.5)
+        height = self.metrics.height()
+        for values, vertical in ((nice_ticks(*self.xlim), True), (nice_ticks(*self.ylim, count=6), False)):
+            step = values[1] - values[0] if len(values) > 1 else 1
+            for value in values:
+                if vertical:
+                    p = self.to_screen(value, self.ylim[0], rect)
+                    painter.setPen(grid)
+                    painter.drawLine(QPointF(p.x(), rect.top()), QPointF(p.x(), rect.bottom()))
+                    painter.setPen(tick)
+                    painter.drawLine(QPointF(p.x(), rect.bottom()), QPointF(p.x(), rect.bottom() - 5))
+                    painter.drawText(QRectF(p.x() - 40, rect.bottom() + 4, 80, height), Qt.AlignHCenter,
+                                     tick_text(value, step))
+                else:
+                    p = self.to_screen(self.xlim[0], value, rect)
+                    painter.setPen(grid)
+                    painter.drawLine(QPointF(rect.left(), p.y()), QPointF(rect.right(), p.y()))
+                    painter.setPen(tick)
+                    painter.drawLine(QPointF(rect.left(), p.y()), QPointF(rect.left() + 5, p.y()))
+                    painter.drawText(QRectF(0, p.y() - height / 2, rect.left() - 6, height),
+                                     Qt.AlignRight | Qt.AlignVCenter, tick_text(value, step))
+        painter.setFont(self.label_font)
+        painter.drawText(QRectF(rect.left(), rect.bottom() + height + 6, rect.width(), height + 8),
+                         Qt.AlignHCenter, self.xlabel)
+        painter.save()
+        painter.translate(4, rect.center().y())
+        painter.rotate(-90)
+        painter.drawText(QRectF(-rect.height() / 2, 0, rect.height(), height + 8), Qt.AlignHCenter, self.ylabel)
+        painter.restore()
+        painter.setFont(self.tick_font)
+
+    def draw_peaks(self, painter, rect):
+        # peaks: (MAX_PEAKS, 3) centroid nm, FWHM nm, height, NaN rows for missing peaks
+        if self.peaks is None:
+            return
+        painter.setPen(QPen(Qt.black, 1))
+        painter.setBrush(Qt.black)
+        for center, fwhm, height in self.peaks:
+            if np.isnan(center):
+                continue
+            p = self.to_screen(center, height, rect)
+            painter.drawPolygon(QPolygonF([p, QPointF(p.x() - 4, p.y() - 7), QPointF(p.x() + 4, p.y() - 7)]))
+            painter.drawText(QRectF(p.x() - 60, p.y() - 9 - 2 * self.metrics.height(), 120,
+                                    2 * self.metrics.height()),
+                             Qt.AlignHCenter | Qt.AlignBottom, f"{center:.1f} nm\nFWHM {fwhm:.1f}")
+        painter.setBrush(Qt.NoBrush)
+
+    def draw_legend(self, painter, rect):
+        # several devices overlaid: label each colour, top right as in the matplotlib view
+        if len(self.traces) < 2:
+            return
+        height = self.metrics.height()
+        width = max(self.metrics.horizontalAdvance(str(key)) for key in self.traces) + 40
+        box = QRectF(rect.right() - width - 8, rect.top() + 8, width, height * len(self.traces) + 8)
+        painter.setPen(QPen(QColor(0, 0, 0, 80), 1))
+        painter.setBrush(QColor(255, 255, 255, 220))
+        painter.drawRect(box)
+        painter.setBrush(Qt.NoBrush)
+        for i, (key, trace) in enumerate(self.traces.items()):
+            y = box.top() + 4 + height * (i + 0.5)
+            painter.setPen(QPen(trace[2], 2))
+            painter.drawLine(QPointF(box.left() + 6, y), QPointF(box.left() + 26, y))
+            painter.setPen(Qt.black)
+            painter.drawText(QRectF(box.left() + 32, y - height / 2, width - 32, height), Qt.AlignVCenter, str(key))
+
+    # navigation, mirroring the matplotlib toolbar: home/back/forward, pan and rubber-band zoom
+
+    def push_view(self):
+        del self.history[self.position + 1:]
+        self.history.append((self.xlim, self.ylim))
+        self.position = len(self.history) - 1
+        self.background = None
+        self.limitsChanged.emit(*self.xlim, *self.ylim)
+        self.update()
+
+    def go_to(self, position):
+        if not 0 <= position < len(self.history):
+            return
+        self.position = position
+        self.xlim, self.ylim = self.history[position]
+        self.background = None
+        self.limitsChanged.emit(*self.xlim, *self.ylim)
+        self.update()
+
+    def home(self):
+        self.go_to(0)
+
+    def back(self):
+        self.go_to(self.position - 1)
+
+    def forward(self):
+        self.go_to(self.position + 1)
+
+    def set_mode(self, mode):
+        self.mode = mode if self.mode != mode else None
+        self.setCursor(Qt.OpenHandCursor if self.mode == "pan" else
+                       Qt.CrossCursor if self.mode == "zoom" else Qt.ArrowCursor)
+
+    def mousePressEvent(self, event):
+        if event.button() == Qt.LeftButton and self.mode is not None:
+            self.drag = (event.pos(), self.xlim, self.ylim)
+
+    def mouseMoveEvent(self, event):
+        rect = self.plot_rect()
+        if rect.contains(QPointF(event.pos())):
+            x, y = self.to_data(QPointF(event.pos()), rect)
+            self.cursorMoved.emit(f"x={x:.2f}  y={y:.4g}")
+        else:
+            self.cursorMoved.emit("")
+        if self.drag is None:
+            return
+        start, (x0, x1), (y0, y1) = self.drag
+        if self.mode == "pan":
+            dx = (event.pos().x() - start.x()) * (x1 - x0) / rect.width()
+            dy = (event.pos().y() - start.y()) * (y1 - y0) / rect.height()
+            self.xlim = (x0 - dx, x1 - dx)
+            self.ylim = (y0 + dy, y1 + dy)
+            self.background = None
+        else:
+            self.rubber = QRectF(QPointF(start), QPointF(event.pos())).normalized() & rect
+        self.update()
+
+    def mouseReleaseEvent(self, event):
+        if self.drag is None:
+            return
+        start = self.drag[0]
+        self.drag = None
+        if self.mode == "zoom":
+            rubber, self.rubber = self.rubber, None
+            if rubber is None or rubber.width() < 5 or rubber.height() < 5:
+                self.update()
+                return
+            rect = self.plot_rect()
+            x0, y1 = self.to_data(rubber.topLeft(), rect)
+            x1, y0 = self.to_data(rubber.bottomRight(), rect)
+            self.xlim, self.ylim = (x0, x1), (y0, y1)
+        elif event.pos() == start:
+            return
+        self.push_view()
+
+    def wheelEvent(self, event):
+        # zoom both axes about the cursor
+        rect = self.plot_rect()
+        if not rect.contains(QPointF(event.pos())):
+            return
+        x, y = self.to_data(QPointF(event.pos()), rect)
+        scale = 0.8 ** (event.angleDelta().y() / 120)
+        self.xlim = (x - (x - self.xlim[0]) * scale, x + (self.xlim[1] - x) * scale)
+        self.ylim = (y - (y - self.ylim[0]) * scale, y + (self.ylim[1] - y) * scale)
+        self.push_view()
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        self.resized.emit()  # new width: the app re-decimates the traces
+
+
+class LiveToolbar(QWidget):
+    def __init__(self, plot, parent=None):
+        super().__init__(parent)
+        self.plot = plot
+        layout = QHBoxLayout(self)
+        layout.setContentsMargins(0, 0, 0, 0)
+        for text, slot in (("Home", plot.home), ("Back", plot.back), ("Forward", plot.forward)):
+            button = QPushButton(text)
+            button.clicked.connect(slot)
+            layout.addWidget(button)
+        self.pan_button = QPushButton("Pan")
+        self.zoom_button = QPushButton("Zoom")
+        for button, mode in ((self.pan_button, "pan"), (self.zoom_button, "zoom")):
+            button.setCheckable(True)
+            button.clicked.connect(lambda checked, mode=mode: self.set_mode(mode))
+            layout.addWidget(button)
+        save_button = QPushButton("Save")
+        save_button.clicked.connect(self.save_figure)
+        layout.addWidget(save_button)
+        layout.addStretch()
+        self.position_label = QLabel("")
+        layout.addWidget(self.position_label)
+        plot.cursorMoved.connect(self.position_label.setText)
+
+    def set_mode(self, mode):
+        self.plot.set_mode(mode)
+        self.pan_button.setChecked(self.plot.mode == "pan")
+        self.zoom_button.setChecked(self.plot.mode == "zoom")
+
+    def save_figure(self):
+        path, _ = QFileDialog.getSaveFileName(self, "Save the plot", "spectrum.png", "Images (*.png *.jpg *.bmp)")
+        if path:
+            self.plot.grab().save(path)
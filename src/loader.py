@@ -0,0 +1,173 @@
+# Fast loading of saved experiment CSVs ("Wavelength (nm)", then one column per
+# measurement) and bulk conversion to the app's HDF5 format (storage.Hdf5Sink).
+#
+#   python loader.py convert /data/2023 --workers 8
+import os
+import re
+import sys
+import glob
+import argparse
+import itertools
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from storage import Hdf5Sink, FRAME_META_DTYPE, HDF5_AVAILABLE
+
+HDF5_EXT = Hdf5Sink.ext
+
+
+def read_labels(path):
+    # column labels after "Wavelength (nm)"
+    with open(path, "r") as f:
+        return f.readline().rstrip("\r\n").split(",")[1:]
+
+
+def count_rows(path):
+    rows = 0
+    last = b"\n"
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            rows += block.count(b"\n")
+            last = block[-1:]
+    if last != b"\n":
+        rows += 1  # no trailing newline
+    return rows - 1  # header
+
+
+def iter_csv(path, columns=None, chunk_rows=256):
+    # Yields (wavelengths, values) for `chunk_rows` pixels at a time; values is
+    # (pixels, measurements) float32 with only the requested measurement columns.
+    num_columns = len(read_labels(path)) + 1
+    if columns is not None:
+        columns = np.asarray(columns, dtype=np.intp) + 1
+    with open(path, "r") as f:
+        f.readline()
+        while True:
+            lines = list(itertools.islice(f, chunk_rows))
+            if not lines:
+                break
+            # numpy's C parser on one comma-separated string, no per-value Python objects
+            text = ",".join(line.rstrip("\n") for line in lines)
+            values = np.fromstring(text, dtype=np.float64, sep=",")
+            if values.size != len(lines) * num_columns:
+                raise ValueError(f"{path}: not a saved experiment CSV (ragged rows)")
+            values = values.reshape(len(lines), num_columns)
+            data = values[:, 1:] if columns is None else values[:, columns]
+            yield values[:, 0], data.astype(np.float32)
+
+
+def load_csv(path, columns=None, chunk_rows=256):
+    # Returns (wavelengths, frames) with frames as a (measurements, pixels) float32
+    # array, like storage.read_stream. The output is allocated once up front and
+    # filled a chunk of rows at a time, so memory stays close to the result size.
+    num_rows = count_rows(path)
+    num_frames = len(read_labels(path)) if columns is None else len(columns)
+    wavelengths = np.empty(num_rows)
+    frames = np.empty((num_frames, num_rows), dtype=np.float32)
+    row = 0
+    for chunk_wavelengths, values in iter_csv(path, columns, chunk_rows):
+        n = len(chunk_wavelengths)
+        wavelengths[row:row + n] = chunk_wavelengths
+        frames[:, row:row + n] = values.T
+        row += n
+    return wavelengths[:row], frames[:, :row]
+
+
+def integration_times(labels, integration_time=None):
+    # "m-i@<t>ms" labels of exposure series, else the time given; NaN if unknown. The
+    # "-<t>ms-" in the file name is not used: it is truncated to an integer (3.8 -> 3).
+    times = [re.search(r"@([0-9.]+)ms$", label) for label in labels]
+    if all(times):
+        return np.array([float(t.group(1)) for t in times])
+    return np.full(len(labels), np.nan if integration_time is None else float(integration_time))
+
+
+def convert_csv(path, out_path=None, chunk_size=64, integration_time=None):
+    # CSV -> HDF5 written by the same sink as a live run, so storage.read_hdf5 and
+    # read_sweep work on converted files. Timestamps of old runs are unknown (NaN).
+    if out_path is None:
+        out_path = os.path.splitext(path)[0] + HDF5_EXT
+    wavelengths, frames = load_csv(path)
+    meta = np.zeros(len(frames), dtype=FRAME_META_DTYPE)
+    meta["timestamp"] = np.nan
+    meta["integration_time"] = integration_times(read_labels(path), integration_time)
+    for name in ("peak_center", "peak_fwhm", "peak_height"):
+        meta[name] = np.nan
+    part_path = out_path + ".part"
+    sink = Hdf5Sink(part_path, wavelengths, {"converted_from": os.path.basename(path)}, chunk_size)
+    sink.open()
+    try:
+        for start in range(0, len(frames), chunk_size):
+            sink.append(frames[start:start + chunk_size], meta[start:start + chunk_size])
+        sink.close()
+    except BaseException:
+        sink.close(convert=False)
+        os.remove(part_path)
+        raise
+    os.replace(part_path, out_path)
+    return out_path
+
+
+def convert_directory(directory, output_dir=None, workers=None, integration_time=None):
+    # Converts every *.csv in `directory` in parallel, one file per process.
+    paths = sorted(glob.glob(os.path.join(directory, "*.csv")))
+    if output_dir is None:
+        output_dir = directory
+    out_paths = [os.path.join(output_dir, os.path.splitext(os.path.basename(p))[0] + HDF5_EXT) for p in paths]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(partial(convert_csv, integration_time=integration_time), paths, out_paths))
+
+
+def load_hdf5(path, columns=None):
+    import h5py
+    with h5py.File(path, "r") as h5:
+        wavelengths = h5["wavelengths"][()]
+        if columns is None:
+            return wavelengths, h5["frames"][()]
+        # h5py selections must be increasing and unique
+        frames, inverse = np.unique(np.asarray(columns, dtype=np.intp), return_inverse=True)
+        return wavelengths, h5["frames"][frames.tolist()][inverse]
+
+
+def load(path, columns=None):
+    # Either format, as (wavelengths, (measurements, pixels) float32 frames):
+    # converted or recorded .h5 files, or CSVs, which are parsed.
+    if path.endswith(HDF5_EXT):
+        return load_hdf5(path, columns)
+    return load_csv(path, columns)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="IICO-Spectra CSV loader")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    convert = subparsers.add_parser("convert", help="convert experiment CSVs to HDF5")
+    convert.add_argument("paths", nargs="+", help="CSV files or directories of CSVs")
+    convert.add_argument("--output-dir", default=None)
+    convert.add_argument("--workers", type=int, default=None, help="processes (default: one per CPU)")
+    convert.add_argument("--integration-time", type=float, default=None,
+                         help="ms, for CSVs without @<t>ms labels (default: NaN)")
+    args = parser.parse_args(argv)
+
+    if not HDF5_AVAILABLE:
+        parser.error("converting to HDF5 requires the h5py package")
+    if args.output_dir is not None and not os.path.isdir(args.output_dir):
+        parser.error(f"output directory does not exist: {args.output_dir}")
+    for path in args.paths:
+        if os.path.isdir(path):
+            converted = convert_directory(path, args.output_dir, args.workers, args.integration_time)
+        elif os.path.isfile(path):
+            out_dir = args.output_dir or os.path.dirname(path)
+            converted = [convert_csv(path, os.path.join(out_dir, os.path.splitext(os.path.basename(path))[0] + HDF5_EXT),
+                                     integration_time=args.integration_time)]
+        else:
+            print(f"No such file or directory: {path}", file=sys.stderr)
+            return 1
+        for out_path in converted:
+            print(out_path)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
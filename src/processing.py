@@ -0,0 +1,364 @@
+import numpy as np
+
+
+class ScanAverager:
+    # Averages `scans` consecutive spectra into one frame and optionally applies a
+    # boxcar (moving average over 2 * boxcar + 1 pixels), like the on-device
+    # averaging of OceanView. All work happens in preallocated arrays.
+    def __init__(self, num_pixels, scans=1, boxcar=0):
+        self.scans = int(scans)
+        self.boxcar = int(boxcar)
+        self.acc = np.zeros(num_pixels)
+        self.out = np.zeros(num_pixels)
+        self.count = 0
+        if self.boxcar:
+            pixels = np.arange(num_pixels)
+            self.lo = np.clip(pixels - self.boxcar, 0, num_pixels)
+            self.hi = np.clip(pixels + self.boxcar + 1, 0, num_pixels)
+            self.width = (self.hi - self.lo).astype(float)
+            self.csum = np.zeros(num_pixels + 1)
+            self.upper = np.zeros(num_pixels)
+            self.lower = np.zeros(num_pixels)
+
+    def add(self, intensities):
+        # Returns the averaged frame once `scans` spectra were added, else None.
+        # The returned array is reused by the next frame.
+        np.add(self.acc, intensities, out=self.acc)
+        self.count += 1
+        if self.count < self.scans:
+            return None
+        np.divide(self.acc, self.count, out=self.out)
+        self.acc[:] = 0
+        self.count = 0
+        if self.boxcar:
+            self.smooth(self.out)
+        return self.out
+
+    def reset(self):
+        self.acc[:] = 0
+        self.count = 0
+
+    def smooth(self, y):
+        np.cumsum(y, out=self.csum[1:])
+        np.take(self.csum, self.hi, out=self.upper)
+        np.take(self.csum, self.lo, out=self.lower)
+        np.subtract(self.upper, self.lower, out=y)
+        np.divide(y, self.width, out=y)
+        return y
+
+
+CORRECTION_MODES = ("dark-subtracted", "transmission", "absorbance")
+PROCESSING_MODES = ("raw",) + CORRECTION_MODES
+
+
+class Correction:
+    # Per-frame background stage: subtract the dark spectrum and, for
+    # transmission/absorbance, divide by the dark-corrected reference (lamp).
+    # The denominator is computed once; each frame reuses one output array.
+    def __init__(self, mode, dark=None, reference=None):
+        if mode not in CORRECTION_MODES:
+            raise ValueError(f"Unknown correction mode: {mode}")
+        if mode == "dark-subtracted" and dark is None:
+            raise ValueError("Capture a dark spectrum first.")
+        if mode in ("transmission", "absorbance") and reference is None:
+            raise ValueError("Capture a reference spectrum first.")
+        self.mode = mode
+        num_pixels = len(dark if dark is not None else reference)
+        self.dark = np.zeros(num_pixels) if dark is None else np.asarray(dark, dtype=float)
+        self.out = np.zeros(num_pixels)
+        if reference is not None:
+            self.denominator = np.asarray(reference, dtype=float) - self.dark
+            self.valid = self.denominator > 0
+            self.invalid = ~self.valid  # pixels without lamp signal are left at 0
+
+    def apply(self, intensities):
+        # Returns the corrected frame; the array is reused by the next call.
+        out = self.out
+        np.subtract(intensities, self.dark, out=out)
+        if self.mode in ("transmission", "absorbance"):
+            np.divide(out, self.denominator, out=out, where=self.valid)
+            out[self.invalid] = 0
+        if self.mode == "absorbance":
+            np.maximum(out, 1e-6, out=out)
+            np.log10(out, out=out)
+            np.negative(out, out=out)
+        return out
+
+
+class AutoExposure:
+    # Proportional exposure control: counts above the dark level scale with the
+    # integration time, so one frame is enough to predict the time that puts the
+    # peak at `target` of full scale. The peak is a high order statistic (robust
+    # to a few hot pixels) found with an in-place partition, O(pixels) per frame.
+    # Reads taken right after a change are discarded by the acquisition loop
+    # (Acquisition.settle_reads), so every frame seen here used `integration_time`.
+    def __init__(self, num_pixels, target=0.8, max_counts=16383, min_time=3.8, max_time=10000,
+                 tolerance=0.05, hot_pixels=8):
+        self.target = target * max_counts
+        self.max_counts = max_counts
+        self.min_time = min_time
+        self.max_time = max_time
+        self.tolerance = tolerance * max_counts
+        self.peak_rank = num_pixels - 1 - hot_pixels
+        self.dark_rank = num_pixels // 100
+        self.work = np.zeros(num_pixels)
+
+    def update(self, intensities, integration_time):
+        # Returns the integration time (ms) for the next frames.
+        self.work[:] = intensities
+        self.work.partition((self.dark_rank, self.peak_rank))
+        dark = self.work[self.dark_rank]
+        peak = self.work[self.peak_rank]
+        if abs(peak - self.target) <= self.tolerance:
+            return integration_time
+        if peak >= 0.98 * self.max_counts:
+            # saturated: the true level is unknown, step down fast
+            new_time = integration_time / 4
+        else:
+            signal = max(peak - dark, 1.0)
+            new_time = integration_time * min((self.target - dark) / signal, 10.0)
+        return round(float(min(max(new_time, self.min_time), self.max_time)), 3)
+
+
+class FrameQC:
+    # Per-read quality checks on raw counts: saturated pixels, upward single-pixel
+    # spikes (cosmic rays) found by comparing each pixel with the 3-point median of
+    # its neighbourhood, and a running hot-pixel map of pixels that spike in at
+    # least `hot_fraction` of the reads. Everything works in preallocated arrays.
+    def __init__(self, num_pixels, max_counts=16383, spike_sigma=8.0, min_spike=50.0, hot_fraction=0.5,
+                 min_frames=20):
+        self.max_counts = max_counts
+        self.spike_sigma = spike_sigma  # threshold in robust standard deviations of the residual
+        self.min_spike = min_spike  # counts, so flat (noise-free) data does not flag everything
+        self.hot_fraction = hot_fraction
+        self.min_frames = min_frames  # reads before the hot-pixel map is trusted
+        self.median = np.zeros(num_pixels)
+        self.lower = np.zeros(num_pixels)
+        self.residual = np.zeros(num_pixels)
+        self.work = np.zeros(num_pixels)
+        self.saturation_mask = np.zeros(num_pixels, dtype=bool)
+        self.spike_mask = np.zeros(num_pixels, dtype=bool)
+        self.spike_counts = np.zeros(num_pixels, dtype=np.int32)
+        self.frames = 0
+        self.saturated = 0
+        self.spikes = 0
+
+    def check(self, intensities):
+        y = intensities
+        np.greater_equal(y, self.max_counts, out=self.saturation_mask)
+        self.saturated = max(self.saturated, int(np.count_nonzero(self.saturation_mask)))
+        # median of (a, b, c) = max(min(a, b), min(max(a, b), c))
+        a, b, c = y[:-2], y[1:-1], y[2:]
+        median = self.median[1:-1]
+        lower = self.lower[1:-1]
+        np.minimum(a, b, out=lower)
+        np.maximum(a, b, out=median)
+        np.minimum(median, c, out=median)
+        np.maximum(lower, median, out=median)
+        self.median[0] = y[0]
+        self.median[-1] = y[-1]
+        np.subtract(y, self.median, out=self.residual)
+        np.abs(self.residual, out=self.work)
+        k = len(self.work) // 2
+        self.work.partition(k)
+        threshold = max(self.spike_sigma * 1.4826 * self.work[k], self.min_spike)
+        np.greater(self.residual, threshold, out=self.spike_mask)
+        self.spikes += int(np.count_nonzero(self.spike_mask))
+        np.add(self.spike_counts, self.spike_mask, out=self.spike_counts)
+        self.frames += 1
+
+    def take(self):
+        # (saturated pixels, spikes, hot pixels) since the last call, for one output frame
+        result = (self.saturated, self.spikes, len(self.hot_pixels()))
+        self.saturated = 0
+        self.spikes = 0
+        return result
+
+    def hot_pixels(self):
+        if self.frames < self.min_frames:
+            return np.empty(0, dtype=np.intp)
+        return np.flatnonzero(self.spike_counts >= self.hot_fraction * self.frames)
+
+
+class PeakTracker:
+    # Finds up to `max_peaks` peaks per frame and measures each one's intensity
+    # centroid (over the part above half maximum) and interpolated FWHM, both
+    # relative to the baseline (a low percentile of the frame).
+    # Candidates are local maxima well above the baseline. Their prominence is the
+    # height above the higher of the minima within `window` pixels on either side
+    # (sampled every `step` pixels), computed for all candidates at once. Once peaks are found, the next frames
+    # only search `track_window` pixels around the previous positions; the full
+    # search runs again when a peak is lost.
+    def __init__(self, wavelengths, max_peaks=3, min_prominence=10.0, window=150, step=3, track_window=15):
+        self.wavelengths = np.asarray(wavelengths, dtype=float)
+        self.num_pixels = len(self.wavelengths)
+        self.pixels = np.arange(self.num_pixels, dtype=float)
+        self.max_peaks = max_peaks
+        self.min_prominence = min_prominence  # in standard deviations of the pixel-to-pixel noise
+        self.window = window
+        self.track_window = track_window
+        self.offsets = np.arange(step, window + 1, step)
+        self.work = np.zeros(self.num_pixels)
+        self.diff = np.zeros(self.num_pixels - 1)
+        self.previous = []
+
+    def update(self, y):
+        # Returns a (max_peaks, 3) array of (centroid nm, FWHM nm, height), NaN where no peak.
+        np.subtract(y[1:], y[:-1], out=self.diff)
+        np.abs(self.diff, out=self.diff)
+        k = len(self.diff) // 2
+        self.diff.partition(k)
+        noise = max(1.4826 * self.diff[k] / np.sqrt(2), 1e-9)
+        self.work[:] = y
+        low = self.num_pixels // 20
+        self.work.partition(low)
+        threshold = self.min_prominence * noise
+        baseline = self.work[low]
+        positions = self.track(y, threshold) if self.previous else []
+        if not positions:
+            positions = self.find(y, baseline, threshold)
+        self.previous = positions
+        result = np.full((self.max_peaks, 3), np.nan)
+        for i, p in enumerate(positions):
+            result[i] = self.measure(y, p, baseline)
+        return result
+
+    def bases(self, y, positions):
+        left = np.clip(positions[:, None] - self.offsets, 0, self.num_pixels - 1)
+        right = np.clip(positions[:, None] + self.offsets, 0, self.num_pixels - 1)
+        return np.maximum(y[left].min(axis=1), y[right].min(axis=1))
+
+    def find(self, y, baseline, threshold):
+        inner = y[1:-1]
+        candidates = np.flatnonzero((inner > y[:-2]) & (inner >= y[2:]) & (inner > baseline + threshold)) + 1
+        if len(candidates) == 0:
+            return []
+        prominence = y[candidates] - self.bases(y, candidates)
+        keep = prominence >= threshold
+        candidates = candidates[keep]
+        picked = []
+        for i in np.argsort(prominence[keep])[::-1]:
+            p = int(candidates[i])
+            if all(abs(p - q) > self.window for q in picked):
+                picked.append(p)
+                if len(picked) == self.max_peaks:
+                    break
+        return sorted(picked)
+
+    def track(self, y, threshold):
+        positions = []
+        for p in self.previous:
+            lo = max(p - self.track_window, 0)
+            hi = min(p + self.track_window + 1, self.num_pixels)
+            q = lo + int(np.argmax(y[lo:hi]))
+            if q in (lo, hi - 1):
+                return []  # the peak moved out of the window
+            positions.append(q)
+        prominence = y[positions] - self.bases(y, np.array(positions))
+        if np.any(prominence < threshold):
+            return []
+        return positions
+
+    def measure(self, y, p, baseline):
+        half = baseline + (y[p] - baseline) / 2
+        lo = max(p - 2 * self.window, 0)
+        hi = min(p + 2 * self.window + 1, self.num_pixels)
+        below = np.flatnonzero(y[lo:p + 1] < half)
+        if len(below):
+            i = lo + below[-1]
+            left = i + (half - y[i]) / (y[i + 1] - y[i])
+        else:
+            left = float(lo)
+        below = np.flatnonzero(y[p:hi] < half)
+        if len(below):
+            i = p + below[0]
+            right = i - (half - y[i]) / (y[i - 1] - y[i])
+        else:
+            right = float(hi - 1)
+        a, b = int(np.ceil(left)), int(np.floor(right)) + 1
+        weights = y[a:b] - half
+        centroid = np.dot(weights, self.pixels[a:b]) / weights.sum() if weights.sum() > 0 else float(p)
+        left_nm, right_nm, center_nm = np.interp([left, right, centroid], self.pixels, self.wavelengths)
+        return center_nm, right_nm - left_nm, y[p]
+
+
+def parse_bands(text):
+    # "440-460, 520-540" -> [(440.0, 460.0), (520.0, 540.0)]
+    bands = []
+    for part in text.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        lo, hi = (float(v) for v in part.split("-"))
+        if hi <= lo:
+            raise ValueError(f"Band {part} must go from low to high wavelength.")
+        bands.append((lo, hi))
+    if not bands:
+        raise ValueError("No bands given.")
+    return bands
+
+
+class BandIntegrator:
+    # Integrated intensity (counts x nm) of wavelength bands. Band edges are
+    # resolved to pixel indices once; each frame then takes one cumulative sum and
+    # two lookups per band, whatever the band widths.
+    def __init__(self, wavelengths, bands):
+        wavelengths = np.asarray(wavelengths, dtype=float)
+        self.lo = np.searchsorted(wavelengths, [lo for lo, _ in bands], side="left")
+        self.hi = np.searchsorted(wavelengths, [hi for _, hi in bands], side="right")
+        if np.any(self.hi <= self.lo):
+            raise ValueError("A band is outside the wavelength range of the device.")
+        self.widths = np.gradient(wavelengths)  # nm per pixel
+        self.work = np.zeros(len(wavelengths))
+        self.csum = np.zeros(len(wavelengths) + 1)
+
+    def integrate(self, y):
+        np.multiply(y, self.widths, out=self.work)
+        np.cumsum(self.work, out=self.csum[1:])
+        return self.csum[self.hi] - self.csum[self.lo]
+
+
+class MinMaxDecimator:
+    # Reduces a trace to a (min, max) pair per horizontal screen pixel of the
+    # visible x-range, so narrow peaks survive while far fewer vertices are drawn.
+    # The bins depend only on the range and the plot width: set_view recomputes
+    # them when either changes and decimate reuses them for every frame.
+    def __init__(self, x):
+        self.x = np.asarray(x, dtype=float)
+        self.view = None
+        self.lo = 0
+        self.hi = len(self.x)
+        self.starts = None
+
+    def set_view(self, xmin, xmax, width):
+        view = (xmin, xmax, width)
+        if view == self.view:
+            return False
+        self.view = view
+        # one point beyond each edge so the trace reaches the axes
+        self.lo = max(int(np.searchsorted(self.x, xmin)) - 1, 0)
+        self.hi = min(int(np.searchsorted(self.x, xmax, side="right")) + 1, len(self.x))
+        count = self.hi - self.lo
+        if count <= 2 * width:
+            self.starts = None  # already no more than two points per pixel
+            return True
+        self.starts = (np.arange(width) * count) // width
+        x = self.x[self.lo:self.hi]
+        self.xd = np.zeros(2 * width)
+        self.xd[0::2] = x[self.starts]
+        self.xd[1::2] = x[np.append(self.starts[1:], count) - 1]  # each pair spans its bin
+        self.ymin = np.zeros(width)
+        self.ymax = np.zeros(width)
+        self.yd = np.zeros(2 * width)
+        return True
+
+    def decimate(self, y):
+        # (x, y) to draw; the arrays are reused by the next call
+        y = y[self.lo:self.hi]
+        if self.starts is None:
+            return self.x[self.lo:self.hi], y
+        np.minimum.reduceat(y, self.starts, out=self.ymin)
+        np.maximum.reduceat(y, self.starts, out=self.ymax)
+        self.yd[0::2] = self.ymin
+        self.yd[1::2] = self.ymax
+        return self.xd, self.yd
@@ -0,0 +1,339 @@
+import os
+import csv
+import queue
+import threading
+import time
+import importlib.util
+from datetime import date
+import numpy as np
+
+# HDF5 output is optional; h5py is only imported when an HDF5 file is used
+HDF5_AVAILABLE = importlib.util.find_spec("h5py") is not None
+
+MAX_PEAKS = 3  # tracked peaks stored per frame
+# integration times are float64 so read_sweep keys equal the times that were asked for
+FRAME_META_DTYPE = np.dtype([("timestamp", "<f8"), ("integration_time", "<f8"),
+                             ("saturated", "<i4"), ("spikes", "<i4"),
+                             ("peak_center", "<f4", (MAX_PEAKS,)), ("peak_fwhm", "<f4", (MAX_PEAKS,)),
+                             ("peak_height", "<f4", (MAX_PEAKS,))])
+# one row per run of consecutive frames taken at the same integration time
+SWEEP_INDEX_DTYPE = np.dtype([("integration_time", "<f8"), ("start", "<i8"), ("count", "<i8")])
+
+
+def save_file_with_number(name,it, path, ext=".csv"):
+    base_name = name 
+    today_date = date.today().strftime('%Y-%m-%d')
+
+    counter = 0
+
+    new_name = f"{base_name}-{it}ms-{today_date}{ext}"
+    complete_path = os.path.join(path, new_name)
+
+    while os.path.exists(complete_path):
+        counter += 1
+        new_name = f"{base_name}{counter}-{it}ms-{today_date}{ext}"
+        complete_path = os.path.join(path, new_name)
+
+    return complete_path
+
+
+class Frame:
+    # Lightweight record handed from the acquisition thread to the GUI. data is a
+    # view into a RingBuffer slot, valid until the buffer wraps around to it again.
+    __slots__ = ("index", "timestamp", "data", "source", "integration_time", "qc", "peaks", "bands")
+
+    def __init__(self, index, timestamp, data, source=None, integration_time=None, qc=None, peaks=None,
+                 bands=None):
+        self.index = index
+        self.timestamp = timestamp
+        self.data = data
+        self.source = source
+        self.integration_time = integration_time  # ms, as used for this frame
+        self.qc = qc  # (saturated pixels, spikes, hot pixels) from processing.FrameQC
+        self.peaks = peaks  # (MAX_PEAKS, 3) centroid nm, FWHM nm, height from processing.PeakTracker
+        self.bands = bands  # integrated band intensities from processing.BandIntegrator
+
+
+class RingBuffer:
+    # Fixed-capacity frame store (frames x pixels). Nothing is allocated per frame:
+    # each write copies the spectrum into the next slot of a preallocated array and
+    # the Frame handed to the GUI points at that slot. The writer copies frames as
+    # they are queued, so the depth only has to cover frames still on their way to
+    # the GUI when the acquisition thread wraps around.
+    def __init__(self, depth, num_pixels, dtype=np.float32):
+        self.depth = int(depth)
+        self.num_pixels = int(num_pixels)
+        self.dtype = np.dtype(dtype)
+        self.buffer = np.zeros((self.depth, self.num_pixels), dtype=self.dtype)
+        self.count = 0  # frames written
+
+    def write(self, frame):
+        slot = self.count % self.depth
+        self.buffer[slot] = frame
+        self.count += 1
+        return slot
+
+
+class DecimatedHistory:
+    # Bounded time series for strip charts: at most `capacity` points whatever the
+    # run length. When full, neighbouring points are averaged in pairs and every
+    # later point averages twice as many samples, so the whole run stays visible
+    # at a resolution that halves each time the history fills up.
+    def __init__(self, capacity, num_series):
+        self.capacity = capacity - capacity % 2
+        self.times = np.zeros(self.capacity)
+        self.values = np.zeros((self.capacity, num_series))
+        self.count = 0
+        self.stride = 1  # samples per point
+        self.acc_time = 0.0
+        self.acc = np.zeros(num_series)
+        self.acc_count = 0
+
+    def append(self, t, values):
+        self.acc_time += t
+        np.add(self.acc, values, out=self.acc)
+        self.acc_count += 1
+        if self.acc_count < self.stride:
+            return
+        if self.count == self.capacity:
+            self.decimate()
+            if self.acc_count < self.stride:
+                return
+        self.times[self.count] = self.acc_time / self.acc_count
+        np.divide(self.acc, self.acc_count, out=self.values[self.count])
+        self.count += 1
+        self.acc_time = 0.0
+        self.acc[:] = 0
+        self.acc_count = 0
+
+    def decimate(self):
+        half = self.capacity // 2
+        self.times[:half] = self.times.reshape(half, 2).mean(axis=1)
+        self.values[:half] = self.values.reshape(half, 2, -1).mean(axis=1)
+        self.count = half
+        self.stride *= 2
+
+
+def read_stream(path):
+    # Raw stream layout: int64 pixel count, float64 wavelengths, then float32 frames.
+    with open(path, "rb") as f:
+        num_pixels = int(np.fromfile(f, dtype="<i8", count=1)[0])
+        wavelengths = np.fromfile(f, dtype="<f8", count=num_pixels)
+    offset = 8 + 8 * num_pixels
+    num_frames = (os.path.getsize(path) - offset) // (4 * num_pixels)
+    if num_frames == 0:
+        return wavelengths, np.empty((0, num_pixels), dtype="<f4")
+    frames = np.memmap(path, dtype="<f4", mode="r", offset=offset, shape=(num_frames, num_pixels))
+    return wavelengths, frames
+
+
+def sweep_index(integration_times):
+    integration_times = np.asarray(integration_times, dtype="<f8")
+    if len(integration_times) == 0:
+        return np.zeros(0, dtype=SWEEP_INDEX_DTYPE)
+    same = integration_times[1:] == integration_times[:-1]
+    same |= np.isnan(integration_times[1:]) & np.isnan(integration_times[:-1])  # unknown (converted CSVs)
+    starts = np.flatnonzero(np.r_[True, ~same])
+    index = np.zeros(len(starts), dtype=SWEEP_INDEX_DTYPE)
+    index["integration_time"] = integration_times[starts]
+    index["start"] = starts
+    index["count"] = np.diff(np.r_[starts, len(integration_times)])
+    return index
+
+
+def stream_to_csv(stream_path, csv_path, block=256, integration_times=None):
+    # Transpose a raw stream into the wide "Wavelength (nm), m-0..m-N" CSV a few
+    # hundred pixels at a time, so memory does not grow with the run length.
+    # Frames of an exposure series are labelled "m-i@<t>ms".
+    wavelengths, frames = read_stream(stream_path)
+    labels = [f"m-{i}" for i in range(len(frames))]
+    if integration_times is not None and len(sweep_index(integration_times)) > 1:
+        labels = [f"{label}@{t:g}ms" for label, t in zip(labels, np.asarray(integration_times).tolist())]
+    with open(csv_path, "w", newline="") as csvfile:
+        writer = csv.writer(csvfile)
+        writer.writerow(["Wavelength (nm)"] + labels)
+        for p0 in range(0, len(wavelengths), block):
+            columns = np.ascontiguousarray(frames[:, p0:p0 + block].T).tolist()
+            writer.writerows([w] + c for w, c in zip(wavelengths[p0:p0 + block].tolist(), columns))
+
+
+def read_hdf5(path):
+    import h5py
+    with h5py.File(path, "r") as h5:
+        return h5["wavelengths"][()], h5["frames"][()], h5["meta"][()], dict(h5.attrs)
+
+
+def read_sweep(path):
+    # {integration time: frames} of an HDF5 exposure series, read step by step. Keys
+    # are rounded like parse_sweep, so files from before float64 times (3.8 stored as
+    # 3.7999999523) still give back the times that were asked for.
+    import h5py
+    with h5py.File(path, "r") as h5:
+        index = h5["index"][()] if "index" in h5 else sweep_index(h5["meta"]["integration_time"])
+        steps = {}
+        for t, start, count in index.tolist():
+            # a time seen again (e.g. auto exposure coming back to it) adds to its frames
+            steps.setdefault(round(float(t), 6), []).append(h5["frames"][start:start + count])
+        return {t: np.concatenate(frames) for t, frames in steps.items()}
+
+
+class CsvSink:
+    # Frames go to a raw .part stream while measuring and become the wide CSV on close.
+    ext = ".csv"
+
+    def __init__(self, file_name, wavelengths, info=None):
+        self.file_name = file_name
+        self.stream_path = file_name + ".part"
+        self.wavelengths = np.asarray(wavelengths, dtype="<f8")
+        self.integration_times = []
+        self.f = None
+
+    def open(self):
+        self.f = open(self.stream_path, "wb")
+        np.array([len(self.wavelengths)], dtype="<i8").tofile(self.f)
+        self.wavelengths.tofile(self.f)
+
+    def append(self, frames, meta):
+        frames.tofile(self.f)
+        self.integration_times.append(meta["integration_time"].copy())
+
+    def sync(self):
+        self.f.flush()
+        os.fsync(self.f.fileno())
+
+    def close(self, convert=True, extras=None):
+        self.f.close()
+        if convert:
+            integration_times = np.concatenate(self.integration_times) if self.integration_times else None
+            stream_to_csv(self.stream_path, self.file_name, integration_times=integration_times)
+            os.remove(self.stream_path)
+
+
+class Hdf5Sink:
+    # Compressed, chunked HDF5: wavelengths stored once, frames and per-frame
+    # metadata appended along an extendable first axis.
+    ext = ".h5"
+
+    def __init__(self, file_name, wavelengths, info=None, chunk_size=64):
+        if not HDF5_AVAILABLE:
+            raise ImportError("HDF5 output requires the h5py package.")
+        self.file_name = file_name
+        self.wavelengths = np.asarray(wavelengths, dtype="<f8")
+        self.info = info or {}
+        self.chunk_size = chunk_size
+        self.h5 = None
+
+    def open(self):
+        import h5py
+        num_pixels = len(self.wavelengths)
+        self.h5 = h5py.File(self.file_name, "w")
+        self.h5.create_dataset("wavelengths", data=self.wavelengths)
+        self.frames = self.h5.create_dataset(
+            "frames", shape=(0, num_pixels), maxshape=(None, num_pixels), dtype="<f4",
+            chunks=(self.chunk_size, num_pixels), compression="gzip", compression_opts=4, shuffle=True)
+        self.meta = self.h5.create_dataset(
+            "meta", shape=(0,), maxshape=(None,), dtype=FRAME_META_DTYPE, chunks=(1024,))
+        for key, value in self.info.items():
+            self.h5.attrs[key] = value
+
+    def append(self, frames, meta):
+        n = len(self.frames)
+        self.frames.resize(n + len(frames), axis=0)
+        self.frames[n:] = frames
+        self.meta.resize(n + len(meta), axis=0)
+        self.meta[n:] = meta
+
+    def sync(self):
+        self.h5.flush()
+
+    def close(self, convert=True, extras=None):
+        if convert:
+            self.h5.create_dataset("index", data=sweep_index(self.meta["integration_time"]))
+            for name, data in (extras or {}).items():
+                self.h5.create_dataset(name, data=data)
+        self.h5.close()
+
+
+SINKS = {"csv": CsvSink, "hdf5": Hdf5Sink}
+
+
+class StreamWriter(threading.Thread):
+    # Background writer fed by a bounded queue. Frames are handed to the sink in
+    # chunks and synced to disk periodically, so a crash loses at most the last
+    # second or so of data and closing the run never blocks the caller.
+    def __init__(self, sink, queue_size=256, chunk_size=64, fsync_interval=1.0, on_finished=None):
+        super().__init__(daemon=True)
+        self.sink = sink
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.chunk = np.zeros((chunk_size, len(sink.wavelengths)), dtype="<f4")
+        self.chunk_meta = np.zeros(chunk_size, dtype=FRAME_META_DTYPE)
+        self.fsync_interval = fsync_interval
+        self.on_finished = on_finished
+        self.no_peaks = np.full((MAX_PEAKS, 3), np.nan, dtype="<f4")
+        self.frames_written = 0
+        self.extras = None
+        self.error = None
+
+    def put(self, frame, timestamp=0.0, integration_time=0.0, saturated=0, spikes=0, peaks=None):
+        # Blocks when the queue is full, so a slow disk throttles acquisition
+        # instead of dropping frames or growing memory.
+        peaks = self.no_peaks if peaks is None else np.array(peaks, dtype="<f4")
+        self.queue.put((np.array(frame, dtype="<f4"), timestamp, integration_time, saturated, spikes,
+                        peaks[:, 0], peaks[:, 1], peaks[:, 2]))
+
+    def close(self, extras=None):
+        # extras: {name: array} of run-level results, stored by sinks that support them (HDF5)
+        self.extras = extras
+        self.queue.put(None)
+
+    def run(self):
+        # Any sink error (OSError from the disk, ValueError/TypeError from h5py, ...)
+        # is recorded and the queue is still drained, so the producer never blocks
+        # and on_finished is always called.
+        try:
+            self.sink.open()
+            ok = True
+        except Exception as e:
+            self.error = e
+            ok = False
+        filled = 0
+        last_sync = time.monotonic()
+        while True:
+            try:
+                item = self.queue.get(timeout=self.fsync_interval)
+            except queue.Empty:
+                item = ()
+            done = item is None
+            if item:
+                self.chunk[filled] = item[0]
+                self.chunk_meta[filled] = item[1:]
+                filled += 1
+            if filled == len(self.chunk) or time.monotonic() - last_sync >= self.fsync_interval or done:
+                if ok:
+                    ok = self.flush(filled)
+                filled = 0
+                last_sync = time.monotonic()
+            if done:
+                break
+        if ok:
+            try:
+                self.sink.close(extras=self.extras)
+            except Exception as e:
+                self.error = e
+                ok = False
+        if self.on_finished is not None:
+            self.on_finished(ok)
+
+    def flush(self, filled):
+        try:
+            self.sink.append(self.chunk[:filled], self.chunk_meta[:filled])
+            self.sink.sync()
+            self.frames_written += filled
+            return True
+        except Exception as e:
+            self.error = e
+            try:
+                self.sink.close(convert=False)
+            except Exception:
+                pass
+            return False